@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+#
+# Compiles svg-lookup.ini into the lookup table piper.svg searches at
+# runtime, so Piper doesn't need to parse the ini file.
+#
+# The table consists of a header, the SVG filenames and the sorted records:
+#   header:   magic "PSVG", format version (u16), number of records (u32),
+#             number of filenames (u16)
+#   filename: length (u8), UTF-8 bytes
+#   record:   bus (u8), vid (u16), pid (u16), version (u32), filename index (u16)
+# All values are big endian, so the first 9 bytes of the records compare in
+# the same order as the (bus, vid, pid, version) tuples they encode.
+#
+# The key format must match piper/svg.py.
+
+import configparser
+import struct
+import sys
+
+BUSES = {'usb': 1, 'bluetooth': 2}
+HEADER = struct.Struct('>4sHIH')
+
+
+def pack_key(match):
+    parts = match.split(':')
+    if len(parts) == 3:
+        parts.append('0')
+    bus, vid, pid, version = parts
+    return struct.pack('>BHHI', BUSES[bus], int(vid, 16), int(pid, 16), int(version))
+
+
+def main():
+    infile = sys.argv[1]
+    outfile = sys.argv[2]
+
+    config = configparser.ConfigParser(strict=True)
+    config.optionxform = lambda option: option
+    config.read(infile)
+    assert config.sections()
+
+    filenames = []
+    records = {}
+    for section in config.sections():
+        svg = config[section]['Svg']
+        if svg not in filenames:
+            filenames.append(svg)
+        for match in config[section]['DeviceMatch'].split(';'):
+            # Like at runtime, the first section listing a match wins.
+            records.setdefault(pack_key(match), filenames.index(svg))
+
+    with open(outfile, 'wb') as f:
+        f.write(HEADER.pack(b'PSVG', 1, len(records), len(filenames)))
+        for filename in filenames:
+            data = filename.encode('utf-8')
+            f.write(struct.pack('>B', len(data)) + data)
+        for key in sorted(records):
+            f.write(key + struct.pack('>H', records[key]))
+    print("Wrote {} matches for {} SVG files to {}".format(len(records), len(filenames), outfile))
+
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,18 @@ class TestSVGLookup(unittest.TestCase):
         for svg in svgs:
             self.assertTrue(Path(svgdir, svg).exists(), msg=svg)
 
+    def test_match_format(self):
+        # Every match must be compilable by generate-svg-lookup-table.py.
+        for name in config.sections():
+            for match in config[name]['DeviceMatch'].split(';'):
+                parts = match.split(':')
+                self.assertIn(len(parts), [3, 4], msg=match)
+                self.assertIn(parts[0], ['usb', 'bluetooth'], msg=match)
+                self.assertLessEqual(int(parts[1], 16), 0xffff, msg=match)
+                self.assertLessEqual(int(parts[2], 16), 0xffff, msg=match)
+                if len(parts) == 4:
+                    self.assertLessEqual(int(parts[3]), 0xffffffff, msg=match)
+
     def test_uniq_match(self):
         matches = [config[s]['DeviceMatch'] for s in config.sections()]
         d = {}
@@ -6,8 +6,7 @@ import sys
 from lxml import etree
 import logging
 
-ns = {'svg': 'http://www.w3.org/2000/svg'}
-style_query = '//svg:rect[@id=\"{}\"][contains(@style, \"{}\")]'
+SVG_NS = '{http://www.w3.org/2000/svg}'
 
 logger = None
 
@@ -28,27 +27,65 @@ class SVGLogger(logging.Logger):
         return logging.getLogger(path)
 
 
-def check_size(root):
-    width = float(root.attrib['width'])
-    height = float(root.attrib['height'])
+class SVGIndex:
+    """
+    The parts of an SVG we check, collected in a single streaming pass over
+    the document: the root's attributes, the identifiers of the top-level
+    groups and a map of the identifiers of all paths, rects, groups and
+    circles to their (tag, style).
+    """
+    # elements can be paths and rects
+    # This includes leaders and lines
+    ELEMENTS = ['path', 'rect', 'g', 'circle']
+
+    def __init__(self, path):
+        self.attrib = {}
+        self.layers = []
+        self.elements = {}
+
+        depth = 0
+        for event, element in etree.iterparse(path, events=('start', 'end')):
+            if event == 'start':
+                if depth == 0:
+                    self.attrib = dict(element.attrib)
+                depth += 1
+                continue
+
+            depth -= 1
+            if element.tag.startswith(SVG_NS):
+                tag = element.tag[len(SVG_NS):]
+                id = element.get('id')
+                if tag in self.ELEMENTS and id is not None:
+                    self.elements[id] = (tag, element.get('style', ''))
+                if depth == 1 and tag == 'g' and id is not None:
+                    self.layers.append(id)
+            if depth > 0:
+                element.clear()
+
+    def has_style(self, id, tag, style):
+        element = self.elements.get(id)
+        return element is not None and element[0] == tag and style in element[1]
+
+
+def check_size(index):
+    width = float(index.attrib['width'])
+    height = float(index.attrib['height'])
     if not 400 < width < 500:
         logger.error("Width is outside of range: {}".format(width))
     if not 400 < height < 500:
         logger.error("Height is outside of range: {}".format(height))
 
 
-def check_layers(root):
+def check_layers(index):
     """
     Check there are layers (well, groups) for the components we require.
     """
-    layer_ids = [g.attrib['id'] for g in root.iterfind('svg:g', ns)]
-
     for layer in ["Device", "Buttons", "LEDs"]:
-        if layer not in layer_ids:
+        if layer not in index.layers:
             logger.error("Missing layer: {}".format(layer))
 
 
-def check_elements(root, prefix, required=0):
+def check_elements(index, prefix, required=0):
     """
     Checks for elements of the form 'prefixN' in the root tag. Any elements
     found must be consecutive or an warning is printed, i.e. if there's a
@@ -57,12 +94,7 @@ def check_elements(root, prefix, required=0):
     If required is nonzero, an error is logged for any missing element with
     an index less than required.
     """
-
-    # elements can be paths and rects
-    # This includes leaders and lines
-    element_ids = []
-    for element in ['path', 'rect', 'g', 'circle']:
-        element_ids += [p.attrib['id'] for p in root.xpath('//svg:{}'.format(element), namespaces=ns) if p.attrib['id'].startswith(prefix)]
+    element_ids = index.elements
 
     idx = 0
     highest = -1
@@ -78,10 +110,8 @@ def check_elements(root, prefix, required=0):
 
             if leader not in element_ids:
                 logger.error("Missing {} for {}".format(leader, e))
-            else:
-                element = root.xpath(style_query.format(leader, 'text-align'), namespaces=ns)
-                if element is None or len(element) != 1 or element[0] is None:
-                    logger.error("Missing style property for {}".format(leader))
+            elif not index.has_style(leader, 'rect', 'text-align'):
+                logger.error("Missing style property for {}".format(leader))
 
             if path not in element_ids:
                 logger.error("Missing {} for {}".format(path, e))
@@ -95,23 +125,22 @@ def check_elements(root, prefix, required=0):
     logger.info("Found {} {}s".format(highest + 1, prefix))
 
 
-def check_leds(root):
-    check_elements(root, "led")
+def check_leds(index):
+    check_elements(index, "led")
 
 
-def check_buttons(root):
-    check_elements(root, "button", 3)
+def check_buttons(index):
+    check_elements(index, "button", 3)
 
 
 def check_svg(path):
     path = os.path.join(os.environ.get('BASEDIR', '.'), path)
-    svg = etree.parse(path)
-    root = svg.getroot()
+    index = SVGIndex(path)
 
-    check_size(root)
-    check_layers(root)
-    check_buttons(root)
-    check_leds(root)
+    check_size(index)
+    check_layers(index)
+    check_buttons(index)
+    check_leds(index)
 
 
 if __name__ == "__main__":
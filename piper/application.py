@@ -46,7 +46,9 @@ class Application(Gtk.Application):
 
     def init_ratbagd(self):
         if self._ratbagd is None:
-            self._ratbag = Ratbagd(self._required_ratbagd_version)
+            self._ratbag = Ratbagd(self._required_ratbagd_version,
+                                   bootstrap_async=True,
+                                   single_subscription=True)
         return self._ratbag
 
     def do_activate(self):
@@ -17,6 +17,7 @@
 from gettext import gettext as _
 
 from .buttondialog import ButtonDialog
+from .connections import SignalConnections
 from .mousemap import MouseMap
 from .optionbutton import OptionButton
 from .ratbagd import RatbagdButton
@@ -39,9 +40,16 @@ class ButtonsPage(Gtk.Box):
         """
         Gtk.Box.__init__(self, *args, **kwargs)
         self._device = ratbagd_device
-        self._device.connect("active-profile-changed",
-                             self._on_active_profile_changed)
+        self._connections = SignalConnections(self)
+        self._connections.connect(self._device, "active-profile-changed",
+                                  self._on_active_profile_changed)
         self._profile = None
+        # The handlers on the current profile's buttons.
+        self._profile_connections = SignalConnections(self)
+        # The option buttons and the ratbagd buttons they are currently bound
+        # to, keyed by button index.
+        self._option_buttons = {}
+        self._ratbagd_buttons = {}
 
         self._mousemap = MouseMap("#Buttons", self._device, spacing=20, border_width=20)
         self.pack_start(self._mousemap, True, True, 0)
@@ -51,30 +59,38 @@ class ButtonsPage(Gtk.Box):
         self.show_all()
 
     def _set_profile(self, profile):
+        # Binds the option buttons to the given profile's buttons. Every
+        # profile has the same buttons, so the option buttons created for the
+        # first profile are kept and only rebound afterwards.
         self._profile = profile
+        self._ratbagd_buttons.clear()
         for ratbagd_button in profile.buttons:
-            button = OptionButton()
+            index = ratbagd_button.index
+            button = self._option_buttons.get(index)
+            if button is None:
+                button = OptionButton()
+                button.connect("clicked", self._on_button_clicked, index)
+                self._mousemap.add(button, "#button{}".format(index))
+                self._sizegroup.add_widget(button)
+                self._option_buttons[index] = button
+            self._ratbagd_buttons[index] = ratbagd_button
             # Set the correct label in the option button.
             self._on_button_mapping_changed(ratbagd_button, None, button)
-            button.connect("clicked", self._on_button_clicked, ratbagd_button)
-            ratbagd_button.connect("notify::mapping",
-                                   self._on_button_mapping_changed, button)
-            ratbagd_button.connect("notify::special",
-                                   self._on_button_mapping_changed, button)
-            ratbagd_button.connect("notify::macro",
-                                   self._on_button_mapping_changed, button)
-            ratbagd_button.connect("notify::action-type",
-                                   self._on_button_mapping_changed, button)
-            self._mousemap.add(button, "#button{}".format(ratbagd_button.index))
-            self._sizegroup.add_widget(button)
+            for signal in ["notify::mapping", "notify::special",
+                           "notify::macro", "notify::action-type"]:
+                self._profile_connections.connect(ratbagd_button, signal,
+                                                  self._on_button_mapping_changed, button)
+
+        # Should a profile ever lack some of the buttons, drop their option
+        # buttons.
+        for index in list(self._option_buttons):
+            if index not in self._ratbagd_buttons:
+                self._option_buttons.pop(index).destroy()
 
     def _on_active_profile_changed(self, device, profile):
-        # Disconnect the notify::action_type signal on the old profile's buttons.
-        for button in self._profile.buttons:
-            button.disconnect_by_func(self._on_button_mapping_changed)
-        # Clear the MouseMap of any children.
-        self._mousemap.foreach(Gtk.Widget.destroy)
-        # Repopulate the MouseMap.
+        # Disconnect the notify signals on the old profile's buttons.
+        self._profile_connections.disconnect_all()
+        # Rebind the option buttons to the new profile.
         self._set_profile(profile)
 
     def _on_button_mapping_changed(self, ratbagd_button, pspec, optionbutton):
@@ -100,9 +116,10 @@ class ButtonsPage(Gtk.Box):
             label = _("Unknown")
         optionbutton.set_label(label)
 
-    def _on_button_clicked(self, button, ratbagd_button):
+    def _on_button_clicked(self, button, index):
         # Presents the ButtonDialog to configure the mouse button corresponding
         # to the clicked button.
+        ratbagd_button = self._ratbagd_buttons[index]
         buttons = self._find_active_profile().buttons
         dialog = ButtonDialog(ratbagd_button, buttons,
                               title=_("Configure button {}").format(ratbagd_button.index),
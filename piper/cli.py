@@ -0,0 +1,187 @@
+# Copyright (C) 2019 Red Hat, Inc
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""The piper-cli command-line tool. It talks to ratbagd through piper.ratbagd
+only, and must never import Gtk, Rsvg or cairo so it works on machines
+without a display.
+
+Profile files are device states as described in piper.devicestate, in
+either their JSON or binary form.
+"""
+
+import argparse
+import sys
+
+from . import devicestate
+from .ratbagd import (Ratbagd, RatbagdDBusTimeout, RatbagdIncompatible,
+                      RatbagdUnavailable, RatbagError)
+
+from gi.repository import GLib  # noqa
+
+
+def _wait_all(futures):
+    # Runs the main loop until all of the given RatbagdFutures have finished.
+    pending = [f for f in futures if not f.done()]
+    if not pending:
+        return
+    mainloop = GLib.MainLoop()
+    remaining = [len(pending)]
+
+    def on_done(future):
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            mainloop.quit()
+
+    for future in pending:
+        future.add_done_callback(on_done)
+    mainloop.run()
+
+
+def _wait(future):
+    # Runs the main loop until the given RatbagdFuture has finished.
+    _wait_all([future])
+    return future.result()
+
+
+def _select_devices(ratbagd, ids):
+    if not ids:
+        return list(ratbagd.devices)
+    devices = []
+    for id in ids:
+        device = ratbagd[id]
+        if device is None:
+            raise ValueError("No device with id {}".format(id))
+        devices.append(device)
+    return devices
+
+
+def _cmd_list(ratbagd, args):
+    for device in ratbagd.devices:
+        print("{}: {} ({})".format(device.id, device.name, device.model))
+    return 0
+
+
+def _cmd_apply(ratbagd, args):
+    with open(args.file, "rb") as f:
+        state = devicestate.load(f.read())
+    devices = _select_devices(ratbagd, args.device)
+    if not devices:
+        print("No devices found", file=sys.stderr)
+        return 1
+
+    # Check every device first so that nothing is written if any of them
+    # does not fit.
+    for device in devices:
+        devicestate.validate(device, state, args.force)
+    # The method calls to all devices are sent before waiting for the first
+    # reply. A device that fails is reported and not committed, the others
+    # still are.
+    status = 0
+    imports = []
+    for device in devices:
+        try:
+            imports.append((device, devicestate.import_device(device, state, args.force)))
+        except (RatbagdDBusTimeout, GLib.Error, RatbagError) as e:
+            print("{}: applying failed: {}".format(device.name, e), file=sys.stderr)
+            status = 1
+    _wait_all([future for device, futures in imports for future in futures])
+    devices = []
+    for device, futures in imports:
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            print("{}: applying failed: {}".format(device.name, errors[0]), file=sys.stderr)
+            status = 1
+        else:
+            devices.append(device)
+    if not devices:
+        return status
+
+    report = _wait(ratbagd.commit_devices(devices, args.resync_timeout))
+    for result in report.results:
+        name = result.device.name
+        if result.error is not None:
+            print("{}: commit failed: {}".format(name, result.error), file=sys.stderr)
+            status = 1
+        elif result.resynced:
+            print("{}: device failed to apply the changes".format(name), file=sys.stderr)
+            status = 1
+        else:
+            print("{}: committed in {:.3f}s".format(name, result.elapsed))
+    print("Committed {} device(s) in {:.3f}s".format(len(report.results), report.elapsed))
+    return status
+
+
+def _cmd_export(ratbagd, args):
+    devices = _select_devices(ratbagd, args.device and [args.device])
+    if len(devices) != 1:
+        raise ValueError("Specify the device to export with --device")
+    state = devicestate.export_device(devices[0])
+    if args.binary:
+        with open(args.file, "wb") as f:
+            f.write(devicestate.to_bytes(state))
+    else:
+        with open(args.file, "w") as f:
+            f.write(devicestate.to_json(state))
+    return 0
+
+
+def main(argv, ratbagd_api_version):
+    """Runs piper-cli with the given arguments, excluding the program name.
+
+    @return The exit status, as int
+    """
+    parser = argparse.ArgumentParser(prog="piper-cli",
+                                     description="Configure gaming mice through ratbagd without a GUI")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    list_parser = subparsers.add_parser("list", help="List the available devices")
+    list_parser.set_defaults(func=_cmd_list)
+
+    apply_parser = subparsers.add_parser("apply", help="Apply a profile file and commit it")
+    apply_parser.add_argument("file", help="The profile file to apply, as JSON or binary")
+    apply_parser.add_argument("--device", action="append", metavar="ID",
+                              help="The id of a device to configure, may be given multiple times (default: all devices)")
+    apply_parser.add_argument("--resync-timeout", type=int, default=1000, metavar="MS",
+                              help="How long to wait for devices to report failures after committing (default: 1000)")
+    apply_parser.add_argument("--force", action="store_true",
+                              help="Apply the file even to devices of a different model than it was exported from")
+    apply_parser.set_defaults(func=_cmd_apply)
+
+    export_parser = subparsers.add_parser("export", help="Save the configuration of a device to a file")
+    export_parser.add_argument("file", help="The profile file to write")
+    export_parser.add_argument("--device", metavar="ID",
+                               help="The id of the device to export (default: the only device)")
+    export_parser.add_argument("--binary", action="store_true",
+                               help="Write the compact binary form instead of JSON")
+    export_parser.set_defaults(func=_cmd_export)
+
+    args = parser.parse_args(argv)
+
+    try:
+        ratbagd = Ratbagd(ratbagd_api_version)
+    except RatbagdUnavailable as e:
+        print("Cannot connect to ratbagd: {}".format(e), file=sys.stderr)
+        return 1
+    except RatbagdIncompatible as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    try:
+        return args.func(ratbagd, args)
+    except (OSError, ValueError, KeyError, RatbagError, RatbagdDBusTimeout, GLib.Error) as e:
+        print("Error: {}".format(e), file=sys.stderr)
+        return 1
@@ -0,0 +1,90 @@
+# Copyright (C) 2019 Red Hat, Inc
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import sys
+from collections import Counter
+
+"""This module contains SignalConnections, which keeps track of the signal
+handlers a widget connects to longer-lived objects such as the ratbagd
+objects, so that they can be disconnected together once the widget goes away.
+
+For debugging, the number of live handlers is counted per object (by object
+path for ratbagd objects). Set PIPER_DEBUG_HANDLERS in the environment to have
+every change printed to stderr."""
+
+_live_handlers = Counter()
+_debug = bool(os.environ.get("PIPER_DEBUG_HANDLERS"))
+
+
+def _get_key(obj):
+    return getattr(obj, "object_path", None) or type(obj).__name__
+
+
+def _count_handler(obj, delta):
+    key = _get_key(obj)
+    _live_handlers[key] += delta
+    if _live_handlers[key] <= 0:
+        del _live_handlers[key]
+    if _debug:
+        print("{} live signal handler(s) on {}".format(_live_handlers[key], key),
+              file=sys.stderr)
+
+
+def get_live_handler_counts():
+    """Returns the number of signal handlers connected through
+    SignalConnections that are still connected, per object.
+
+    @return A dict of object path (or type name for objects without one) to
+            the number of handlers, as {str: int}
+    """
+    return dict(_live_handlers)
+
+
+class SignalConnections:
+    """A set of signal handlers that are disconnected together, either
+    explicitly or when the owning widget is destroyed."""
+
+    def __init__(self, owner=None):
+        """Instantiates a new set of signal handlers.
+
+        @param owner The widget whose lifetime the handlers are bound to, as
+                     Gtk.Widget, or None to only disconnect them explicitly
+        """
+        self._handlers = []
+        if owner is not None:
+            owner.connect("destroy", lambda widget: self.disconnect_all())
+
+    def connect(self, obj, signal, callback, *args):
+        """Connects the given callback to the given signal of the given object.
+
+        @param obj The object to connect to, as GObject.Object
+        @param signal The detailed name of the signal, as str
+        @param callback The callback to connect, as callable
+        @param args Extra arguments passed to the callback
+        @return The handler id, as int
+        """
+        handler = obj.connect(signal, callback, *args)
+        self._handlers.append((obj, handler))
+        _count_handler(obj, 1)
+        return handler
+
+    def disconnect_all(self):
+        """Disconnects all handlers connected through this object."""
+        handlers, self._handlers = self._handlers, []
+        for obj, handler in handlers:
+            obj.disconnect(handler)
+            _count_handler(obj, -1)
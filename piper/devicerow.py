@@ -14,15 +14,13 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-from piper.svg import get_svg
-
-import sys
+from piper.thumbnails import get_thumbnail_async
 
 from .gi_composites import GtkTemplate
 
 import gi
 gi.require_version("Gtk", "3.0")
-from gi.repository import GdkPixbuf, GObject, Gtk, Rsvg  # noqa
+from gi.repository import GObject, Gtk  # noqa
 
 
 @GtkTemplate(ui="/org/freedesktop/Piper/ui/DeviceRow.ui")
@@ -40,25 +38,27 @@ class DeviceRow(Gtk.ListBoxRow):
         self.init_template()
         self._device = device
         self.title.set_text(device.name)
-
-        try:
-            svg_bytes = get_svg(device.model)
-            handle = Rsvg.Handle.new_from_data(svg_bytes)
-            svg = handle.get_pixbuf_sub("#Device")
-            handle.close()
-            if svg is None:
-                print("Device {}'s SVG is incompatible".format(device.name), file=sys.stderr)
-            else:
-                svg = svg.scale_simple(50, 50, GdkPixbuf.InterpType.BILINEAR)
-                if svg is None:
-                    print("Cannot resize device SVG", file=sys.stderr)
-                else:
-                    self.image.set_from_pixbuf(svg)
-        except FileNotFoundError:
-            print("Device {} has no image or its path is invalid".format(device.name), file=sys.stderr)
+        self._update_image()
+        self.connect("notify::scale-factor", lambda row, pspec: self._update_image())
 
         self.show_all()
 
+    def _update_image(self):
+        # Fetches the device's thumbnail at the row's current scale factor. The
+        # placeholder icon stays until the thumbnail has been rendered, or for
+        # good if the device has no usable SVG.
+        scale_factor = self.get_scale_factor()
+        get_thumbnail_async(self._device.model, scale_factor,
+                            lambda surface: self._on_thumbnail_loaded(surface, scale_factor))
+
+    def _on_thumbnail_loaded(self, surface, scale_factor):
+        if scale_factor != self.get_scale_factor():
+            # The scale factor changed while rendering; a new thumbnail is on
+            # its way.
+            return
+        if surface is not None:
+            self.image.set_from_surface(surface)
+
     @GObject.Property
     def device(self):
         return self._device
@@ -0,0 +1,440 @@
+# Copyright (C) 2019 Red Hat, Inc
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Export and import of the full configuration of a device. Like piper.cli,
+this module must not import Gtk, Rsvg or cairo.
+
+A device state is a dict of the form:
+
+    {
+        "version": 1,
+        "model": "usb:046d:c539:0",
+        "profiles": [
+            {
+                "index": 0,
+                "enabled": true,
+                "active": true,
+                "name": "Gaming",
+                "report_rate": 1000,
+                "resolutions": [
+                    {"index": 0, "resolution": [800], "active": true, "default": true}
+                ],
+                "buttons": [
+                    {"index": 0, "button": 1},
+                    {"index": 3, "special": "WHEEL_UP"},
+                    {"index": 4, "macro": [[1, 30], [2, 30]]},
+                    {"index": 5, "disabled": true}
+                ],
+                "leds": [
+                    {"index": 0, "mode": "BREATHING", "color": [255, 0, 0],
+                     "brightness": 255, "effect_duration": 1000}
+                ]
+            }
+        ]
+    }
+
+When importing, every key but the indices is optional and anything not
+listed is left untouched, so hand-written files only need to list what they
+change. A missing version is treated as version 1.
+
+The state is stored either as JSON, or in a compact binary form for bulk
+storage, see to_bytes() and from_bytes().
+"""
+
+import json
+import struct
+
+from .ratbagd import RatbagdButton, RatbagdLed, RatbagdMacro
+
+"""The current version of the device state format."""
+VERSION = 1
+
+_MAGIC = b"PIPR"
+
+# The struct formats of the binary form, all little endian. Strings are
+# stored as a byte length followed by UTF-8. The header is followed by the
+# model string and the profiles.
+#
+# A profile is stored as index, flags, report rate and the number of
+# resolutions, buttons and LEDs, followed by its name. A macro button stores
+# the number of events as its value, followed by the events.
+_HEADER = struct.Struct("<4sBB")      # magic, version, number of profiles
+_PROFILE = struct.Struct("<BBHBBB")
+_RESOLUTION = struct.Struct("<BBII")  # index, flags, xres, yres
+_BUTTON = struct.Struct("<BBI")       # index, action type, value
+_MACRO_EVENT = struct.Struct("<BI")   # type, value
+_LED = struct.Struct("<BB3BBI")       # index, mode, color, brightness, duration
+
+_PROFILE_ENABLED = 0x1
+_PROFILE_ACTIVE = 0x2
+_RESOLUTION_ACTIVE = 0x1
+_RESOLUTION_DEFAULT = 0x2
+_RESOLUTION_SEPARATE_Y = 0x4
+
+
+def _export_button(props):
+    button = {"index": props["Index"]}
+    action_type, value = props["Mapping"]
+    if action_type == RatbagdButton.ActionType.BUTTON:
+        button["button"] = value
+    elif action_type == RatbagdButton.ActionType.SPECIAL:
+        try:
+            button["special"] = RatbagdButton.ActionSpecial(value).name
+        except ValueError:
+            pass
+    elif action_type == RatbagdButton.ActionType.MACRO:
+        button["macro"] = [list(event) for event in value]
+    elif action_type == RatbagdButton.ActionType.NONE:
+        button["disabled"] = True
+    return button
+
+
+def export_device(device):
+    """Returns the full state of the given device. The state is read in one
+    batch through RatbagdDevice.snapshot().
+
+    @param device The device to export, as ratbagd.RatbagdDevice
+    @return The device state, as dict
+    """
+    snapshot = device.snapshot()
+    profiles = []
+    for profile in snapshot.profiles:
+        props = profile.properties
+        resolutions = []
+        for resolution in profile.resolutions:
+            res = resolution.properties["Resolution"]
+            resolutions.append({
+                "index": resolution.properties["Index"],
+                "resolution": list(res) if isinstance(res, tuple) else [res],
+                "active": resolution.properties["IsActive"],
+                "default": resolution.properties["IsDefault"],
+            })
+        leds = []
+        for led in profile.leds:
+            leds.append({
+                "index": led.properties["Index"],
+                "mode": RatbagdLed.Mode(led.properties["Mode"]).name,
+                "color": list(led.properties["Color"]),
+                "brightness": led.properties["Brightness"],
+                "effect_duration": led.properties["EffectDuration"],
+            })
+        profiles.append({
+            "index": props["Index"],
+            "enabled": props["Enabled"],
+            "active": props["IsActive"],
+            "name": props["Name"],
+            "report_rate": props["ReportRate"],
+            "resolutions": resolutions,
+            "buttons": [_export_button(b.properties) for b in profile.buttons],
+            "leds": leds,
+        })
+    return {
+        "version": VERSION,
+        "model": snapshot.properties["Model"],
+        "profiles": profiles,
+    }
+
+
+def _find(objects, index, what):
+    for obj in objects:
+        if obj.index == index:
+            return obj
+    raise ValueError("{} {} does not exist".format(what, index))
+
+
+def _set(obj, attr, value):
+    # Only write values that differ, so importing a full export doesn't fail
+    # on e.g. a profile name the device doesn't allow changing.
+    if getattr(obj, attr) != value:
+        setattr(obj, attr, value)
+
+
+def _import_resolution(resolution, state, futures):
+    if "resolution" in state:
+        _set(resolution, "resolution", tuple(state["resolution"]))
+    if state.get("default") and not resolution.is_default:
+        futures.append(resolution.set_default_async())
+    if state.get("active") and not resolution.is_active:
+        futures.append(resolution.set_active_async())
+
+
+def _import_button(button, state, futures):
+    if state.get("disabled"):
+        if button.action_type != RatbagdButton.ActionType.NONE:
+            futures.append(button.disable_async())
+    elif "button" in state:
+        _set(button, "mapping", state["button"])
+    elif "special" in state:
+        _set(button, "special", RatbagdButton.ActionSpecial[state["special"]])
+    elif "macro" in state:
+        button.macro = RatbagdMacro.from_ratbag([tuple(e) for e in state["macro"]])
+
+
+def _import_led(led, state, futures):
+    if "mode" in state:
+        _set(led, "mode", RatbagdLed.Mode[state["mode"]])
+    if "color" in state:
+        _set(led, "color", tuple(state["color"]))
+    if "brightness" in state:
+        _set(led, "brightness", state["brightness"])
+    if "effect_duration" in state:
+        _set(led, "effect_duration", state["effect_duration"])
+
+
+def _resolve(device, state):
+    # Looks up the objects the given state applies to and checks the values
+    # that can be checked without writing them. Returns a list of
+    # (profile, profile state, [(function, object, state)]).
+    plan = []
+    for profile_state in state.get("profiles", []):
+        profile = _find(device.profiles, profile_state["index"], "Profile")
+        children = []
+        for s in profile_state.get("resolutions", []):
+            resolution = _find(profile.resolutions, s["index"], "Resolution")
+            if "resolution" in s and len(s["resolution"]) != len(resolution.resolution):
+                raise ValueError("Resolution {} takes {} value(s)".format(s["index"], len(resolution.resolution)))
+            children.append((_import_resolution, resolution, s))
+        for s in profile_state.get("buttons", []):
+            if "special" in s and s["special"] not in RatbagdButton.ActionSpecial.__members__:
+                raise ValueError("Unknown special action {}".format(s["special"]))
+            children.append((_import_button,
+                             _find(profile.buttons, s["index"], "Button"), s))
+        for s in profile_state.get("leds", []):
+            if "mode" in s and s["mode"] not in RatbagdLed.Mode.__members__:
+                raise ValueError("Unknown LED mode {}".format(s["mode"]))
+            children.append((_import_led,
+                             _find(profile.leds, s["index"], "LED"), s))
+        plan.append((profile, profile_state, children))
+    return plan
+
+
+def _validate(device, state, force):
+    # Validates the state, see validate(), and returns its plan, see
+    # _resolve().
+    version = state.get("version", 1)
+    if version > VERSION:
+        raise ValueError("Unsupported device state version {}".format(version))
+    model = state.get("model")
+    if model is not None and model != device.model and not force:
+        raise ValueError("The device state is for model {}, but {} is a {}".format(model, device.name, device.model))
+    return _resolve(device, state)
+
+
+def validate(device, state, force=False):
+    """Checks that the given state can be written to the device, without
+    writing anything.
+
+    @param device The device to configure, as ratbagd.RatbagdDevice
+    @param state The device state, as dict
+    @param force If True, the state may have been exported from a different
+                 device model
+    @raises ValueError if the state does not fit the device or has an
+                       unsupported version
+    """
+    _validate(device, state, force)
+
+
+def import_device(device, state, force=False):
+    """Writes the given state to the device through its setters. The whole
+    state is validated before anything is written. The writes are batched by
+    ratbagd.py and sent once the device is committed, which is left to the
+    caller. Methods such as setting the active profile are called without
+    waiting for ratbagd; wait for all of the returned futures before
+    committing, so that the calls to many devices overlap.
+
+    @param device The device to configure, as ratbagd.RatbagdDevice
+    @param state The device state, as dict
+    @param force If True, the state may have been exported from a different
+                 device model
+    @return The futures of the method calls, as [ratbagd.RatbagdFuture]
+    @raises ValueError if the state does not fit the device or has an
+                       unsupported version, see validate()
+    """
+    futures = []
+    for profile, profile_state, children in _validate(device, state, force):
+        if "enabled" in profile_state:
+            _set(profile, "enabled", profile_state["enabled"])
+        if "name" in profile_state:
+            _set(profile, "name", profile_state["name"])
+        if "report_rate" in profile_state:
+            _set(profile, "report_rate", profile_state["report_rate"])
+        for function, obj, s in children:
+            function(obj, s, futures)
+        if profile_state.get("active") and not profile.is_active:
+            futures.append(profile.set_active_async())
+    return futures
+
+
+def to_json(state):
+    """Serializes the given device state to a JSON string."""
+    return json.dumps(state, indent=4)
+
+
+def _pack_string(string):
+    data = string.encode("utf-8")
+    return struct.pack("<B", len(data)) + data
+
+
+def to_bytes(state):
+    """Serializes the given device state to its compact binary form. The state
+    must be complete, like the ones returned by export_device().
+
+    @param state The device state, as dict
+    @return The binary form, as bytes
+    """
+    out = [_HEADER.pack(_MAGIC, VERSION, len(state["profiles"])),
+           _pack_string(state["model"])]
+    for profile in state["profiles"]:
+        flags = 0
+        if profile["enabled"]:
+            flags |= _PROFILE_ENABLED
+        if profile["active"]:
+            flags |= _PROFILE_ACTIVE
+        out.append(_PROFILE.pack(profile["index"], flags, profile["report_rate"],
+                                 len(profile["resolutions"]),
+                                 len(profile["buttons"]),
+                                 len(profile["leds"])))
+        out.append(_pack_string(profile["name"] or ""))
+        for resolution in profile["resolutions"]:
+            res = resolution["resolution"]
+            flags = 0
+            if resolution["active"]:
+                flags |= _RESOLUTION_ACTIVE
+            if resolution["default"]:
+                flags |= _RESOLUTION_DEFAULT
+            if len(res) > 1:
+                flags |= _RESOLUTION_SEPARATE_Y
+            out.append(_RESOLUTION.pack(resolution["index"], flags, res[0], res[-1]))
+        for button in profile["buttons"]:
+            macro = []
+            if button.get("disabled"):
+                action_type, value = RatbagdButton.ActionType.NONE, 0
+            elif "button" in button:
+                action_type, value = RatbagdButton.ActionType.BUTTON, button["button"]
+            elif "special" in button:
+                action_type = RatbagdButton.ActionType.SPECIAL
+                value = RatbagdButton.ActionSpecial[button["special"]]
+            elif "macro" in button:
+                macro = button["macro"]
+                action_type, value = RatbagdButton.ActionType.MACRO, len(macro)
+            else:
+                # An action we could not export; leave it untouched on import.
+                action_type, value = 0xff, 0
+            out.append(_BUTTON.pack(button["index"], action_type, value))
+            out += [_MACRO_EVENT.pack(*event) for event in macro]
+        for led in profile["leds"]:
+            out.append(_LED.pack(led["index"], RatbagdLed.Mode[led["mode"]],
+                                 *led["color"], led["brightness"],
+                                 led["effect_duration"]))
+    return b"".join(out)
+
+
+class _Reader:
+    # Reads consecutive structs and strings from a buffer.
+
+    def __init__(self, data):
+        self._data = memoryview(data)
+        self._offset = 0
+
+    def read(self, fmt):
+        values = fmt.unpack_from(self._data, self._offset)
+        self._offset += fmt.size
+        return values
+
+    def read_string(self):
+        length = self._data[self._offset]
+        start = self._offset + 1
+        self._offset = start + length
+        return bytes(self._data[start:self._offset]).decode("utf-8")
+
+
+def from_bytes(data):
+    """Deserializes a device state from its compact binary form.
+
+    @param data The binary form, as bytes
+    @return The device state, as dict
+    @raises ValueError if the data is not a supported device state
+    """
+    try:
+        reader = _Reader(data)
+        magic, version, nprofiles = reader.read(_HEADER)
+        if magic != _MAGIC:
+            raise ValueError("Not a device state")
+        if version > VERSION:
+            raise ValueError("Unsupported device state version {}".format(version))
+        state = {"version": version, "model": reader.read_string(), "profiles": []}
+        for _ in range(nprofiles):
+            index, flags, report_rate, nres, nbuttons, nleds = reader.read(_PROFILE)
+            profile = {
+                "index": index,
+                "enabled": bool(flags & _PROFILE_ENABLED),
+                "active": bool(flags & _PROFILE_ACTIVE),
+                "name": reader.read_string(),
+                "report_rate": report_rate,
+                "resolutions": [],
+                "buttons": [],
+                "leds": [],
+            }
+            for _ in range(nres):
+                index, flags, xres, yres = reader.read(_RESOLUTION)
+                res = [xres, yres] if flags & _RESOLUTION_SEPARATE_Y else [xres]
+                profile["resolutions"].append({
+                    "index": index,
+                    "resolution": res,
+                    "active": bool(flags & _RESOLUTION_ACTIVE),
+                    "default": bool(flags & _RESOLUTION_DEFAULT),
+                })
+            for _ in range(nbuttons):
+                index, action_type, value = reader.read(_BUTTON)
+                button = {"index": index}
+                if action_type == RatbagdButton.ActionType.NONE:
+                    button["disabled"] = True
+                elif action_type == RatbagdButton.ActionType.BUTTON:
+                    button["button"] = value
+                elif action_type == RatbagdButton.ActionType.SPECIAL:
+                    button["special"] = RatbagdButton.ActionSpecial(value).name
+                elif action_type == RatbagdButton.ActionType.MACRO:
+                    button["macro"] = [list(reader.read(_MACRO_EVENT))
+                                       for _ in range(value)]
+                profile["buttons"].append(button)
+            for _ in range(nleds):
+                index, mode, r, g, b, brightness, duration = reader.read(_LED)
+                profile["leds"].append({
+                    "index": index,
+                    "mode": RatbagdLed.Mode(mode).name,
+                    "color": [r, g, b],
+                    "brightness": brightness,
+                    "effect_duration": duration,
+                })
+            state["profiles"].append(profile)
+    except (struct.error, IndexError, UnicodeDecodeError):
+        raise ValueError("Truncated or corrupt device state")
+    return state
+
+
+def load(data):
+    """Deserializes a device state from either its JSON or binary form.
+
+    @param data The serialized state, as bytes
+    @return The device state, as dict
+    @raises ValueError if the data is not a device state
+    """
+    if data.startswith(_MAGIC):
+        return from_bytes(data)
+    state = json.loads(data.decode("utf-8"))
+    if not isinstance(state, dict):
+        raise ValueError("Not a device state: expected a JSON object, got {}".format(type(state).__name__))
+    return state
@@ -16,6 +16,7 @@
 
 from gettext import gettext as _
 
+from .connections import SignalConnections
 from .leddialog import LedDialog
 from .mousemap import MouseMap
 from .optionbutton import OptionButton
@@ -39,9 +40,16 @@ class LedsPage(Gtk.Box):
         """
         Gtk.Box.__init__(self, *args, **kwargs)
         self._device = ratbagd_device
-        self._device.connect("active-profile-changed",
-                             self._on_active_profile_changed)
+        self._connections = SignalConnections(self)
+        self._connections.connect(self._device, "active-profile-changed",
+                                  self._on_active_profile_changed)
         self._profile = None
+        # The handlers on the current profile's LEDs.
+        self._profile_connections = SignalConnections(self)
+        # The option buttons and the LEDs they are currently bound to, keyed
+        # by LED index.
+        self._option_buttons = {}
+        self._leds = {}
 
         self._mousemap = MouseMap("#Leds", self._device, spacing=20, border_width=20)
         self.pack_start(self._mousemap, True, True, 0)
@@ -51,31 +59,46 @@ class LedsPage(Gtk.Box):
         self.show_all()
 
     def _set_profile(self, profile):
+        # Binds the option buttons to the given profile's LEDs. Every profile
+        # has the same LEDs, so the option buttons created for the first
+        # profile are kept and only rebound afterwards.
         self._profile = profile
+        self._leds.clear()
         for led in profile.leds:
+            index = led.index
             mode = _(RatbagdLed.LED_DESCRIPTION[led.mode])
-            button = OptionButton(mode)
-            button.connect("clicked", self._on_button_clicked, led)
-            led.connect("notify::mode", self._on_led_mode_changed, button)
-            self._mousemap.add(button, "#led{}".format(led.index))
-            self._sizegroup.add_widget(button)
+            button = self._option_buttons.get(index)
+            if button is None:
+                button = OptionButton(mode)
+                button.connect("clicked", self._on_button_clicked, index)
+                self._mousemap.add(button, "#led{}".format(index))
+                self._sizegroup.add_widget(button)
+                self._option_buttons[index] = button
+            else:
+                button.set_label(mode)
+            self._leds[index] = led
+            self._profile_connections.connect(led, "notify::mode", self._on_led_mode_changed, button)
+
+        # Should a profile ever lack some of the LEDs, drop their option
+        # buttons.
+        for index in list(self._option_buttons):
+            if index not in self._leds:
+                self._option_buttons.pop(index).destroy()
 
     def _on_active_profile_changed(self, device, profile):
         # Disconnect the notify::mode signal on the old profile's LEDs.
-        for led in self._profile.leds:
-            led.disconnect_by_func(self._on_led_mode_changed)
-        # Clear the MouseMap of any children.
-        self._mousemap.foreach(Gtk.Widget.destroy)
-        # Repopulate the MouseMap.
+        self._profile_connections.disconnect_all()
+        # Rebind the option buttons to the new profile.
         self._set_profile(profile)
 
     def _on_led_mode_changed(self, led, pspec, button):
         mode = _(RatbagdLed.LED_DESCRIPTION[led.mode])
         button.set_label(mode)
 
-    def _on_button_clicked(self, button, led):
+    def _on_button_clicked(self, button, index):
         # Presents the LedDialog to configure the LED corresponding to the
         # clicked button.
+        led = self._leds[index]
         dialog = LedDialog(led, transient_for=self.get_toplevel())
         dialog.connect("response", self._on_dialog_response, led)
         dialog.present()
@@ -16,10 +16,16 @@
 
 import cairo
 import gi
+import io
+import re
 import sys
+import threading
+from array import array
+from collections import OrderedDict
 from lxml import etree
 
 from piper.svg import get_svg
+from piper.worker import run_in_thread
 
 gi.require_version("Gdk", "3.0")
 gi.require_version("Gtk", "3.0")
@@ -32,6 +38,182 @@ pages. The MouseMap widget draws the device SVG in the center and lays out a
 bunch of child widgets relative to the leaders in the device SVG."""
 
 
+# The style flags of the elements in _MouseMapSvg.elements.
+_STYLE_TEXT_ALIGN = 0x1
+_STYLE_TEXT_ALIGN_END = 0x2
+
+
+class _MouseMapSvg:
+    # A helper class holding a parsed device SVG. These are shared between
+    # all MouseMaps of the same device model, see _get_mousemap_svg, and
+    # immutable apart from the rendered device layer, which is only used from
+    # the main thread.
+
+    # The elements whose geometry we need: buttons and LEDs, their leaders and
+    # their paths.
+    _GEOMETRY_ID = re.compile(r"^(button|led)[0-9]+(-leader|-path)?$")
+
+    def __init__(self, svg_bytes):
+        self.handle = Rsvg.Handle.new_from_data(svg_bytes)
+        # The #Device layer rendered at each scale factor, see
+        # get_device_surface.
+        self._device_surfaces = {}
+
+        # The index of all elements with an identifier, built in a single
+        # streaming pass over the document. It maps "#<id>" to a tuple of the
+        # element's tag name, its style flags and the offset of its geometry
+        # in _geometry (-1 if we have none).
+        #
+        # Querying librsvg for an element's geometry is expensive, so we do it
+        # once for every element we may need. The geometries are stored as
+        # consecutive (x, y, width, height) values in _geometry.
+        self.elements = {}
+        self._geometry = array("i")
+        for event, element in etree.iterparse(io.BytesIO(svg_bytes)):
+            svg_id = element.get("id")
+            if svg_id is not None:
+                offset = -1
+                if self._GEOMETRY_ID.match(svg_id) is not None:
+                    offset = self._add_geometry("#" + svg_id)
+                self.elements["#" + svg_id] = (etree.QName(element).localname,
+                                               self._get_style_flags(element.get("style")),
+                                               offset)
+            element.clear()
+
+    def _add_geometry(self, svg_id):
+        # Appends the geometry of the given element to _geometry and returns
+        # its offset, or -1 if librsvg cannot tell us the geometry.
+        ok, pos = self.handle.get_position_sub(svg_id)
+        if not ok:
+            return -1
+        ok, dim = self.handle.get_dimensions_sub(svg_id)
+        if not ok:
+            return -1
+        offset = len(self._geometry)
+        self._geometry.extend((pos.x, pos.y, dim.width, dim.height))
+        return offset
+
+    @staticmethod
+    def _get_style_flags(style):
+        # Returns the style flags for the given style attribute value.
+        flags = 0
+        if style is None:
+            return flags
+        for declaration in style.split(";"):
+            name, _, value = declaration.partition(":")
+            if name.strip() == "text-align":
+                flags |= _STYLE_TEXT_ALIGN
+                if value.strip() == "end":
+                    flags |= _STYLE_TEXT_ALIGN_END
+        return flags
+
+    def has_style(self, svg_id, tag, flags):
+        # Checks if the element with the given identifier is of the given tag
+        # and has all of the given style flags set.
+        element = self.elements.get(svg_id)
+        return element is not None and element[0] == tag and element[1] & flags == flags
+
+    def render(self, svg_ids, scale_factor):
+        # Renders the SVG elements with the given identifiers into a new
+        # surface of the SVG's size at the given scale factor.
+        width = self.handle.props.width
+        height = self.handle.props.height
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                                     width * scale_factor,
+                                     height * scale_factor)
+        surface.set_device_scale(scale_factor, scale_factor)
+        cr = cairo.Context(surface)
+        for svg_id in svg_ids:
+            self.handle.render_cairo_sub(cr, id=svg_id)
+        return surface
+
+    def get_device_surface(self, scale_factor):
+        # Returns the #Device layer rendered at the given scale factor. It is
+        # the same for every MouseMap of the device, so it is rendered once.
+        surface = self._device_surfaces.get(scale_factor)
+        if surface is None:
+            surface = self.render(["#Device"], scale_factor)
+            self._device_surfaces[scale_factor] = surface
+        return surface
+
+    def get_geometry(self, svg_id):
+        # Returns the (x, y, width, height) of the SVG element with the given
+        # identifier, or None if it is not known.
+        element = self.elements.get(svg_id)
+        if element is None or element[2] < 0:
+            return None
+        offset = element[2]
+        return tuple(self._geometry[offset:offset + 4])
+
+
+# The most recently used parsed SVGs, keyed by device model. Every stack page
+# has its own MouseMap of the same device, so this saves parsing the SVG
+# three times per device. SVGs may be parsed in a worker thread, see
+# prefetch_svg, so the cache and the SVGs still being parsed are protected by
+# _svg_cache_lock.
+_SVG_CACHE_SIZE = 4
+_svg_cache = OrderedDict()
+_svg_pending = {}
+_svg_cache_lock = threading.Lock()
+
+
+def _cache_mousemap_svg(model, svg):
+    # Inserts the given SVG into the cache. The caller must hold the lock.
+    _svg_cache.pop(model, None)
+    _svg_cache[model] = svg
+    while len(_svg_cache) > _SVG_CACHE_SIZE:
+        _svg_cache.popitem(last=False)
+
+
+def _load_mousemap_svg(model):
+    # Parses the SVG of the given device model in a worker thread.
+    try:
+        svg = _MouseMapSvg(get_svg(model))
+        with _svg_cache_lock:
+            _cache_mousemap_svg(model, svg)
+        return svg
+    finally:
+        with _svg_cache_lock:
+            _svg_pending.pop(model, None)
+
+
+def _get_mousemap_svg(model):
+    # Returns the parsed SVG for the given device model, parsing it only if it
+    # is neither in the cache nor being parsed in a worker thread already.
+    with _svg_cache_lock:
+        svg = _svg_cache.get(model)
+        if svg is not None:
+            _cache_mousemap_svg(model, svg)
+            return svg
+        future = _svg_pending.get(model)
+        if future is not None and future.cancel():
+            # The worker has not started on it yet, e.g. because it is busy
+            # rendering thumbnails, so parsing it here is quicker than
+            # waiting.
+            del _svg_pending[model]
+            future = None
+    if future is not None:
+        return future.result()
+
+    svg = _MouseMapSvg(get_svg(model))
+    with _svg_cache_lock:
+        _cache_mousemap_svg(model, svg)
+    return svg
+
+
+def prefetch_svg(model):
+    """Parses the SVG of the given device model in a worker thread, so that
+    the MouseMaps of such a device can be created without doing so on the
+    main thread.
+
+    @param model The device model, see ratbagd.RatbagdDevice.model
+    """
+    with _svg_cache_lock:
+        if model in _svg_cache or model in _svg_pending:
+            return
+        _svg_pending[model] = run_in_thread(_load_mousemap_svg, model)
+
+
 class _MouseMapChild:
     # A helper class to manage children and their properties.
 
@@ -108,9 +290,8 @@ class MouseMap(Gtk.Container):
         if ratbagd_device is None:
             raise ValueError("Device cannot be None")
         try:
-            svg_bytes = get_svg(ratbagd_device.model)
-            self._handle = Rsvg.Handle.new_from_data(svg_bytes)
-            self._svg_data = etree.fromstring(svg_bytes)
+            self._svg = _get_mousemap_svg(ratbagd_device.model)
+            self._handle = self._svg.handle
         except FileNotFoundError:
             raise ValueError("Device has no image or its path is invalid")
 
@@ -123,6 +304,17 @@ class MouseMap(Gtk.Container):
         self._children = []
         self._highlight_element = None
 
+        # The rendered SVG layers, see _get_surfaces. They are rendered at
+        # _surface_scale and dropped when the scale factor or the children
+        # change.
+        self._surface_scale = None
+        self._overlay_surface = None
+        self._highlight_surfaces = {}
+
+        # The maximum natural widths of the children on either side of the
+        # SVG, see _get_child_widths.
+        self._child_widths = None
+
         # TODO: remove this when we're out of the transition to toned down SVGs
         device = self._handle.has_sub("#Device")
         buttons = self._handle.has_sub("#Buttons")
@@ -140,14 +332,16 @@ class MouseMap(Gtk.Container):
                       is to be paired, as str
         """
         svg_leader = svg_id + "-leader"
-        if widget is None or svg_id is None or not \
-            self._handle.has_sub(svg_id) or not \
-                self._handle.has_sub(svg_leader):
+        if widget is None or svg_id is None or \
+                svg_id not in self._svg.elements or \
+                svg_leader not in self._svg.elements:
             return
 
-        is_left = self._xpath_has_style(svg_leader[1:], "text-align:end")
+        is_left = self._svg.has_style(svg_leader, "rect", _STYLE_TEXT_ALIGN_END)
         child = _MouseMapChild(widget, is_left, svg_id)
         self._children.append(child)
+        self._overlay_surface = None
+        self._child_widths = None
         widget.connect("enter-notify-event", self._on_enter, child)
         widget.connect("leave-notify-event", self._on_leave)
         widget.set_parent(self)
@@ -161,6 +355,8 @@ class MouseMap(Gtk.Container):
             for child in self._children:
                 if child.widget == widget:
                     self._children.remove(child)
+                    self._overlay_surface = None
+                    self._child_widths = None
                     child.widget.unparent()
                     break
 
@@ -215,14 +411,12 @@ class MouseMap(Gtk.Container):
         width, the natural child widths (left and right), spacing and border
         width.
         """
+        # GTK+ only calls us when a resize was queued, so this is where the
+        # cached child widths are refreshed.
+        self._child_widths = None
+        width_left, width_right = self._get_child_widths()
         width = 2 * self.props.border_width
         width_svg = self._handle.props.width
-        width_left = [child.widget.get_preferred_width()[1] for child in
-                      self._children if child.is_left]
-        width_right = [child.widget.get_preferred_width()[1] for child in
-                       self._children if not child.is_left]
-        width_left = max(width_left, default=0)
-        width_right = max(width_right, default=0)
         width += width_left + width_svg + width_right + self.spacing
         if width_left > 0:
             width += self.spacing
@@ -267,13 +461,13 @@ class MouseMap(Gtk.Container):
         for child in self._children:
             if not child.widget.get_visible():
                 continue
-            svg_geom = self._get_svg_sub_geometry(child.svg_leader)[1]
+            svg_x, svg_y, svg_width, svg_height = self._get_svg_sub_geometry(child.svg_leader)[1]
             nat_size = child.widget.get_preferred_size()[1]
             if child.is_left:
-                child_allocation.x = x + svg_geom.x - self.spacing - nat_size.width
+                child_allocation.x = x + svg_x - self.spacing - nat_size.width
             else:
-                child_allocation.x = x + svg_geom.x + self.spacing
-            child_allocation.y = y + svg_geom.y + 0.5 * svg_geom.height - 0.5 * nat_size.height
+                child_allocation.x = x + svg_x + self.spacing
+            child_allocation.y = y + svg_y + 0.5 * svg_height - 0.5 * nat_size.height
             child_allocation.width = nat_size.width
             child_allocation.height = nat_size.height
             if not child.widget.get_has_window():
@@ -326,56 +520,46 @@ class MouseMap(Gtk.Container):
         self._highlight_element = None
         self._redraw_svg_element(old_highlight)
 
-    def _xpath_has_style(self, svg_id, style):
-        # Checks if the SVG element with the given identifier has the given
-        # style attribute set.
-        namespaces = {
-            'sodipodi': 'http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd',
-            'cc': 'http://web.resource.org/cc/',
-            'svg': 'http://www.w3.org/2000/svg',
-            'dc': 'http://purl.org/dc/elements/1.1/',
-            'xlink': 'http://www.w3.org/1999/xlink',
-            'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
-            'inkscape': 'http://www.inkscape.org/namespaces/inkscape'
-        }
-        query = "//svg:rect[@id=\"{}\"][contains(@style, \"{}\")]".format(svg_id, style)
-        element = self._svg_data.xpath(query, namespaces=namespaces)
-        return element is not None and len(element) == 1 and element[0] is not None
-
     def _get_svg_sub_geometry(self, svg_id):
         # Helper method to get an SVG element's x- and y-coordinates, width and
-        # height.
-        ret = Gdk.Rectangle()
-        ok, svg_pos = self._handle.get_position_sub(svg_id)
-        if not ok:
-            print("Warning: cannot retrieve element's position:", svg_id,
+        # height from the geometry precomputed when the SVG was loaded.
+        geometry = self._svg.get_geometry(svg_id)
+        if geometry is None:
+            print("Warning: cannot retrieve element's geometry:", svg_id,
                   file=sys.stderr)
-            return ok, ret
-        ret.x = svg_pos.x
-        ret.y = svg_pos.y
-
-        ok, svg_dim = self._handle.get_dimensions_sub(svg_id)
-        if not ok:
-            print("Warning: cannot retrieve element's dimensions:", svg_id,
-                  file=sys.stderr)
-            return ok, ret
-        ret.width = svg_dim.width
-        ret.height = svg_dim.height
-        return ok, ret
+            return False, (0, 0, 0, 0)
+        return True, geometry
 
     def _redraw_svg_element(self, svg_id):
         # Helper method to redraw an element of the SVG image. Attempts to
         # redraw only the element (plus an offset), but will fall back to
         # redrawing the complete SVG.
         x, y = self._translate_to_origin()
-        ok, svg_geom = self._get_svg_sub_geometry(svg_id)
+        ok, (svg_x, svg_y, svg_width, svg_height) = self._get_svg_sub_geometry(svg_id)
         if not ok:
             svg_width = self._handle.props.width
             svg_height = self._handle.props.height
             self.queue_draw_area(x, y, svg_width, svg_height)
         else:
-            self.queue_draw_area(x + svg_geom.x - 10, y + svg_geom.y - 10,
-                                 svg_geom.width + 20, svg_geom.height + 20)
+            self.queue_draw_area(x + svg_x - 10, y + svg_y - 10,
+                                 svg_width + 20, svg_height + 20)
+
+    def _get_child_widths(self):
+        # Returns the maximum natural widths of the children on the left and
+        # on the right of the SVG. These are only computed again after the
+        # children changed or a resize was queued, so that drawing and
+        # allocating do not need a size request of every child.
+        if self._child_widths is None:
+            width_left = 0
+            width_right = 0
+            for child in self._children:
+                width = child.widget.get_preferred_width()[1]
+                if child.is_left:
+                    width_left = max(width_left, width)
+                else:
+                    width_right = max(width_right, width)
+            self._child_widths = width_left, width_right
+        return self._child_widths
 
     def _translate_to_origin(self):
         # Translates the coordinate system such that the SVG and its buttons
@@ -385,9 +569,7 @@ class MouseMap(Gtk.Container):
         width = self.get_preferred_width()[1]
         height = self.get_preferred_height()[1]
 
-        width_left = [child.widget.get_preferred_width()[1] for child in
-                      self._children if child.is_left]
-        width_left = max(width_left, default=0)
+        width_left = self._get_child_widths()[0]
         if width_left > 0:
             width_left += self.spacing
 
@@ -395,26 +577,50 @@ class MouseMap(Gtk.Container):
         y = (allocation.height - height) / 2 + self.props.border_width
         return round(x), round(y)
 
+    def _get_surfaces(self):
+        # Returns the surfaces of the device and of the leaders and paths of
+        # all children, rendering them if needed. Rasterizing the SVG is by far
+        # the most expensive part of drawing, so we only do it again when the
+        # scale factor or the children have changed. The device layer is
+        # shared with the other MouseMaps of the device, see
+        # _MouseMapSvg.get_device_surface.
+        scale_factor = self.get_scale_factor()
+        if scale_factor != self._surface_scale:
+            self._surface_scale = scale_factor
+            self._overlay_surface = None
+            self._highlight_surfaces = {}
+
+        if self._overlay_surface is None:
+            svg_ids = []
+            for child in self._children:
+                svg_ids.append(child.svg_path)
+                svg_ids.append(child.svg_leader)
+            self._overlay_surface = self._svg.render(svg_ids, scale_factor)
+        return self._svg.get_device_surface(scale_factor), self._overlay_surface
+
+    def _get_highlight_surface(self, svg_id):
+        # Returns the surface used as a mask to highlight the given element,
+        # rendering it if needed. Must be called after _get_surfaces.
+        surface = self._highlight_surfaces.get(svg_id)
+        if surface is None:
+            surface = self._svg.render([svg_id], self._surface_scale)
+            self._highlight_surfaces[svg_id] = surface
+        return surface
+
     def _draw_device(self, cr):
         # Draws the SVG into the Cairo context. If there is an element to be
-        # highlighted, it will do as such in a separate surface which will be
-        # used as a mask over the device surface.
-        style_context = self.get_style_context()
-        style_context.save()
-        color = style_context.get_color(Gtk.StateFlags.LINK)
-        style_context.restore()
-        cr.set_source_rgba(color.red, color.green, color.blue, 0.5)
-
-        self._handle.render_cairo_sub(cr, id="#Device")
+        # highlighted, its rendered surface will be used as a mask to paint
+        # the highlight color over the device.
+        device_surface, overlay_surface = self._get_surfaces()
+
+        cr.set_source_surface(device_surface, 0, 0)
+        cr.paint()
         if self._highlight_element is not None:
-            svg_surface = cr.get_target()
-            highlight_surface = svg_surface.create_similar(cairo.CONTENT_COLOR_ALPHA,
-                                                           self._handle.props.width,
-                                                           self._handle.props.height)
-            highlight_context = cairo.Context(highlight_surface)
-            self._handle.render_cairo_sub(highlight_context,
-                                          self._highlight_element)
-            cr.mask_surface(highlight_surface, 0, 0)
-        for child in self._children:
-            self._handle.render_cairo_sub(cr, id=child.svg_path)
-            self._handle.render_cairo_sub(cr, id=child.svg_leader)
+            style_context = self.get_style_context()
+            style_context.save()
+            color = style_context.get_color(Gtk.StateFlags.LINK)
+            style_context.restore()
+            cr.set_source_rgba(color.red, color.green, color.blue, 0.5)
+            cr.mask_surface(self._get_highlight_surface(self._highlight_element), 0, 0)
+        cr.set_source_surface(overlay_surface, 0, 0)
+        cr.paint()
@@ -14,9 +14,14 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import sys
+
+from collections import OrderedDict
+from functools import partial
 from gettext import gettext as _
 
 from .buttonspage import ButtonsPage
+from .connections import SignalConnections
 from .gi_composites import GtkTemplate
 from .profilerow import ProfileRow
 from .resolutionspage import ResolutionsPage
@@ -27,6 +32,24 @@ gi.require_version("Gtk", "3.0")
 from gi.repository import GLib, GObject, Gtk  # noqa
 
 
+class _DevicePages:
+    # The stack pages and profile rows built for a device. These are kept
+    # while other devices are shown, so that switching back to the device
+    # does not need to build them again.
+
+    def __init__(self, device, pages, rows):
+        self.device = device
+        # The stack pages, as [(Gtk.Widget, name, title)].
+        self.pages = pages
+        self.rows = rows
+
+    def destroy(self):
+        for page, name, title in self.pages:
+            page.destroy()
+        for row in self.rows:
+            row.destroy()
+
+
 @GtkTemplate(ui="/org/freedesktop/Piper/ui/MousePerspective.ui")
 class MousePerspective(Gtk.Overlay):
     """The perspective to configure a mouse."""
@@ -36,18 +59,28 @@ class MousePerspective(Gtk.Overlay):
     _titlebar = GtkTemplate.Child()
     stack = GtkTemplate.Child()
     notification_error = GtkTemplate.Child()
+    notification_error_label = GtkTemplate.Child()
     listbox_profiles = GtkTemplate.Child()
     label_profile = GtkTemplate.Child()
     add_profile_button = GtkTemplate.Child()
     button_commit = GtkTemplate.Child()
     button_profile = GtkTemplate.Child()
 
+    # The number of devices whose pages are kept, see set_device.
+    _PAGE_CACHE_SIZE = 4
+
     def __init__(self, *args, **kwargs):
         """Instantiates a new MousePerspective."""
         Gtk.Overlay.__init__(self, *args, **kwargs)
         self.init_template()
         self._device = None
+        self._device_connections = SignalConnections(self)
         self._notification_error_timeout_id = 0
+        self._notification_error_message = self.notification_error_label.get_label()
+
+        # The pages of the most recently shown devices, keyed by device id.
+        self._page_cache = OrderedDict()
+        self.connect("destroy", self._on_destroy)
 
     @GObject.Property
     def name(self):
@@ -81,18 +114,25 @@ class MousePerspective(Gtk.Overlay):
         return self._device
 
     def set_device(self, device):
+        self._unset_device()
         self._device = device
-        device.connect("resync", lambda _: self._show_notification_error())
+        self._device_connections.connect(device, "resync", lambda _: self._show_notification_error())
 
-        self.stack.foreach(Gtk.Widget.destroy)
-        active_profile = device.active_profile
-        if active_profile.resolutions:
-            self.stack.add_titled(ResolutionsPage(device), "resolutions", _("Resolutions"))
-        if active_profile.buttons:
-            self.stack.add_titled(ButtonsPage(device), "buttons", _("Buttons"))
-        if active_profile.leds:
-            self.stack.add_titled(LedsPage(device), "leds", _("LEDs"))
+        pages = self._page_cache.pop(device.id, None)
+        if pages is not None and pages.device is not device:
+            # The device was reconnected since we built its pages.
+            pages.destroy()
+            pages = None
+        if pages is None:
+            pages = self._build_pages(device)
+        self._page_cache[device.id] = pages
+        while len(self._page_cache) > self._PAGE_CACHE_SIZE:
+            self._page_cache.popitem(last=False)[1].destroy()
 
+        for page, name, title in pages.pages:
+            self.stack.add_titled(page, name, title)
+
+        active_profile = device.active_profile
         self.button_profile.set_visible(len(device.profiles) > 1)
         name = active_profile.name
         if not name:
@@ -105,22 +145,76 @@ class MousePerspective(Gtk.Overlay):
         left = next((p for p in device.profiles if not p.enabled), None)
         self.add_profile_button.set_visible(left is not None)
 
-        self.listbox_profiles.foreach(Gtk.Widget.destroy)
-        for profile in device.profiles:
-            profile.connect("notify::enabled", self._on_profile_notify_enabled)
-            profile.connect("notify::dirty", self._on_profile_notify_dirty)
-            row = ProfileRow(profile)
+        for profile, row in zip(device.profiles, pages.rows):
+            self._device_connections.connect(profile, "notify::enabled", self._on_profile_notify_enabled)
+            self._device_connections.connect(profile, "notify::dirty", self._on_profile_notify_dirty)
             self.listbox_profiles.insert(row, profile.index)
             if profile is active_profile:
                 self.listbox_profiles.select_row(row)
 
+    def remove_device(self, device):
+        """Destroys the pages kept for the given device, which has been
+        removed. If it is the device being shown, the perspective is left
+        without a device.
+
+        @param device The removed device, as ratbagd.RatbagdDevice
+        """
+        if device is self._device:
+            self._unset_device()
+            self._device = None
+        pages = self._page_cache.get(device.id)
+        if pages is not None and pages.device is device:
+            del self._page_cache[device.id]
+            pages.destroy()
+
+    def _build_pages(self, device):
+        # Builds the stack pages and profile rows for the given device. The
+        # pages that were built already are destroyed if a later one cannot
+        # be, so that they do not stay connected to the device.
+        pages = _DevicePages(device, [], [])
+        active_profile = device.active_profile
+        try:
+            if active_profile.resolutions:
+                pages.pages.append((ResolutionsPage(device), "resolutions", _("Resolutions")))
+            if active_profile.buttons:
+                pages.pages.append((ButtonsPage(device), "buttons", _("Buttons")))
+            if active_profile.leds:
+                pages.pages.append((LedsPage(device), "leds", _("LEDs")))
+            for profile in device.profiles:
+                pages.rows.append(ProfileRow(profile))
+        except Exception:
+            pages.destroy()
+            raise
+        return pages
+
+    def _unset_device(self):
+        # Takes the current device's pages and rows out of the perspective
+        # without destroying them, and disconnects from the device.
+        self._device_connections.disconnect_all()
+        # The page cache holds a reference to the widgets, so removing them
+        # from their containers keeps them alive.
+        for child in self.stack.get_children():
+            self.stack.remove(child)
+        for child in self.listbox_profiles.get_children():
+            self.listbox_profiles.remove(child)
+
+    def _on_destroy(self, perspective):
+        # The cached pages are not in the stack, so they have to be destroyed
+        # explicitly to disconnect them from their devices.
+        for pages in self._page_cache.values():
+            pages.destroy()
+        self._page_cache.clear()
+
     def _hide_notification_error(self):
         if self._notification_error_timeout_id != 0:
             GLib.Source.remove(self._notification_error_timeout_id)
             self._notification_error_timeout_id = 0
         self.notification_error.set_reveal_child(False)
 
-    def _show_notification_error(self):
+    def _show_notification_error(self, message=None):
+        # Shows the given message, or the one about a resync if None.
+        self._hide_notification_error()
+        self.notification_error_label.set_label(message or self._notification_error_message)
         self.notification_error.set_reveal_child(True)
         self._notification_error_timeout_id = GLib.timeout_add_seconds(5,
                                                                        self._on_notification_error_timeout)
@@ -131,7 +225,26 @@ class MousePerspective(Gtk.Overlay):
 
     @GtkTemplate.Callback
     def _on_save_button_clicked(self, button):
-        self._device.commit()
+        # Committing may take a while on e.g. wireless devices, so don't block
+        # the UI while ratbagd handles it.
+        for page in self.stack.get_children():
+            if isinstance(page, ResolutionsPage):
+                page.write_pending_resolutions()
+        self.button_commit.set_sensitive(False)
+        self._device.commit_async().add_done_callback(partial(self._on_commit_finished, self._device))
+
+    def _on_commit_finished(self, device, future):
+        if future.exception() is not None:
+            print("Failed to commit: {}".format(future.exception()), file=sys.stderr)
+            self._show_notification_error(_("Failed to apply the changes to {}.").format(device.name))
+        if device is not self._device:
+            # Another device is shown now; its button follows its own
+            # profiles.
+            return
+        if future.exception() is not None or any(profile.dirty for profile in device.profiles):
+            # Changes that failed or were made while the commit was pending
+            # are still to be committed.
+            self.button_commit.set_sensitive(True)
 
     @GtkTemplate.Callback
     def _on_notification_error_close_clicked(self, button):
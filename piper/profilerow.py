@@ -14,6 +14,9 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import sys
+
+from .connections import SignalConnections
 from .gi_composites import GtkTemplate
 
 import gi
@@ -34,7 +37,8 @@ class ProfileRow(Gtk.ListBoxRow):
         Gtk.ListBoxRow.__init__(self, *args, **kwargs)
         self.init_template()
         self._profile = profile
-        self._profile.connect("notify::enabled", self._on_profile_notify_enabled)
+        self._connections = SignalConnections(self)
+        self._connections.connect(self._profile, "notify::enabled", self._on_profile_notify_enabled)
 
         name = profile.name
         if not name:
@@ -53,7 +57,11 @@ class ProfileRow(Gtk.ListBoxRow):
 
     def set_active(self):
         """Activates the profile paired with this row."""
-        self._profile.set_active()
+        self._profile.set_active_async().add_done_callback(self._on_set_active_finished)
+
+    def _on_set_active_finished(self, future):
+        if future.exception() is not None:
+            print("Failed to activate profile: {}".format(future.exception()), file=sys.stderr)
 
     @GObject.Property
     def name(self):
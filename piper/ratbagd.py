@@ -22,10 +22,17 @@
 # DEALINGS IN THE SOFTWARE.
 
 import os
+import re
 import sys
 import hashlib
+import time
+import weakref
 
+from collections import namedtuple
+from collections.abc import Sequence
 from enum import IntEnum
+from functools import partial
+from types import MappingProxyType
 from evdev import ecodes
 from gettext import gettext as _
 from gi.repository import Gio, GLib, GObject  # noqa
@@ -84,6 +91,11 @@ class RatbagdDBusTimeout(Exception):
     pass
 
 
+class RatbagdWriteError(Exception):
+    """Signals that ratbagd rejected one or more property writes."""
+    pass
+
+
 class RatbagError(Exception):
     """A common base exception to catch any ratbag exception."""
     pass
@@ -124,44 +136,319 @@ EXCEPTION_TABLE = {
 }
 
 
+class RatbagdFuture:
+    """The pending result of an asynchronous ratbagd call. The result becomes
+    available from the GLib main loop; use add_done_callback() to be notified,
+    or await the future from a coroutine started with run_coroutine().
+    """
+
+    def __init__(self):
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        """True if the call has finished, successfully or not."""
+        return self._done
+
+    def result(self):
+        """Returns the result of the call, or raises the exception the call
+        failed with.
+
+        @raises RuntimeError if the call has not finished yet.
+        """
+        if not self._done:
+            raise RuntimeError("Result is not ready yet")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        """Returns the exception the call failed with, or None.
+
+        @raises RuntimeError if the call has not finished yet.
+        """
+        if not self._done:
+            raise RuntimeError("Result is not ready yet")
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """Calls the given callback with this future as argument once the call
+        has finished. If it has already finished, the callback is invoked
+        immediately. Callbacks are invoked in the order they were added.
+
+        @param callback The function to call, as callable(RatbagdFuture)
+        """
+        if self._done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def __await__(self):
+        if not self._done:
+            yield self
+        return self.result()
+
+
+def run_coroutine(coroutine):
+    """Runs the given coroutine on the GLib main loop. The coroutine may await
+    any RatbagdFuture, e.g. those returned by RatbagdDevice.commit_async(). It
+    runs until its first await before this function returns.
+
+    @param coroutine The coroutine object to run
+    @return A RatbagdFuture resolving to the coroutine's return value
+    """
+    future = RatbagdFuture()
+
+    def step(awaited=None):
+        try:
+            if awaited is not None and awaited.exception() is not None:
+                pending = coroutine.throw(awaited.exception())
+            else:
+                pending = coroutine.send(awaited.result() if awaited else None)
+        except StopIteration as e:
+            future.set_result(e.value)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            pending.add_done_callback(step)
+
+    step()
+    return future
+
+
+"""Immutable snapshots of a device's state as returned by
+RatbagdDevice.snapshot(). The properties are read-only mappings of the DBus
+property names to their unpacked values, with arrays as tuples and
+dictionaries as read-only mappings."""
+RatbagdObjectSnapshot = namedtuple("RatbagdObjectSnapshot",
+                                   ["object_path", "properties"])
+RatbagdProfileSnapshot = namedtuple("RatbagdProfileSnapshot",
+                                    ["object_path", "properties",
+                                     "resolutions", "buttons", "leds"])
+RatbagdDeviceSnapshot = namedtuple("RatbagdDeviceSnapshot",
+                                   ["object_path", "properties", "profiles"])
+
+
+def _freeze(value):
+    # Returns an immutable copy of the given unpacked DBus value.
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    return value
+
+
+"""The outcome of committing a device through Ratbagd.commit_devices(). The
+error is the exception the commit failed with or None, resynced is True if
+ratbagd emitted Resync for the device, i.e. it failed to write the changes,
+and elapsed is the time ratbagd took to reply, in seconds."""
+RatbagdCommitResult = namedtuple("RatbagdCommitResult",
+                                 ["device", "error", "resynced", "elapsed"])
+
+"""The outcome of Ratbagd.commit_devices(): a RatbagdCommitResult per device
+and the total time the batch took, in seconds."""
+RatbagdCommitReport = namedtuple("RatbagdCommitReport", ["results", "elapsed"])
+
+
 class _RatbagdDBus(GObject.GObject):
     _dbus = None
 
-    def __init__(self, interface, object_path):
-        super().__init__()
+    # Proxies created ahead of time by _RatbagdProxyLoader, keyed by
+    # (interface, object path). They are consumed by the first object that
+    # is constructed for that interface and object path.
+    _preloaded_proxies = {}
 
-        if _RatbagdDBus._dbus is None:
-            try:
-                _RatbagdDBus._dbus = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
-            except GLib.Error as e:
-                raise RatbagdUnavailable(e.message)
+    # All live objects keyed by their class, i.e. their interface, and object
+    # path. See _instance().
+    _registry = weakref.WeakValueDictionary()
 
-        ratbag1 = "org.freedesktop.ratbag1"
-        if os.environ.get('RATBAG_TEST'):
-            ratbag1 = "org.freedesktop.ratbag_devel1"
+    # Property writes not yet sent to ratbagd, keyed by (interface, object
+    # path, property), and the idle source that will send them.
+    _pending_writes = {}
+    _flush_source = 0
+
+    # The number of property writes queued per object path, so a commit can
+    # tell whether anything on its device was changed while it was pending,
+    # see RatbagdDevice._write_generation.
+    _write_counts = {}
+
+    # The messages of the property writes ratbagd rejected, keyed by (object
+    # path, property), until the property is written successfully. Committing
+    # a device fails while any of its writes are in here, see
+    # _get_failed_writes.
+    _failed_writes = {}
 
+    # The _RatbagdSignalRouter delivering our signals, if any. Without one,
+    # each object connects to the signals of its own proxy.
+    _signal_router = None
+
+    def __init__(self, interface, object_path):
+        super().__init__()
+
+        ratbag1 = _RatbagdDBus._bus_name()
         if object_path is None:
             object_path = "/" + ratbag1.replace('.', '/')
 
         self._object_path = object_path
         self._interface = "{}.{}".format(ratbag1, interface)
 
-        try:
-            self._proxy = Gio.DBusProxy.new_sync(_RatbagdDBus._dbus,
-                                                 Gio.DBusProxyFlags.NONE,
-                                                 None,
-                                                 ratbag1,
-                                                 object_path,
-                                                 self._interface,
-                                                 None)
-        except GLib.Error as e:
-            raise RatbagdUnavailable(e.message)
+        self._proxy = _RatbagdDBus._preloaded_proxies.pop((self._interface, object_path), None)
+        if self._proxy is None:
+            try:
+                self._proxy = Gio.DBusProxy.new_sync(_RatbagdDBus._get_bus(),
+                                                     _RatbagdDBus._proxy_flags(),
+                                                     None,
+                                                     ratbag1,
+                                                     object_path,
+                                                     self._interface,
+                                                     None)
+            except GLib.Error as e:
+                raise RatbagdUnavailable(e.message)
 
         if self._proxy.get_name_owner() is None:
             raise RatbagdUnavailable("No one currently owns {}".format(ratbag1))
 
-        self._proxy.connect("g-properties-changed", self._on_properties_changed)
-        self._proxy.connect("g-signal", self._on_signal_received)
+        if _RatbagdDBus._signal_router is not None:
+            # The proxy still keeps its property cache up to date; it just
+            # relies on the router's match rule to receive PropertiesChanged.
+            _RatbagdDBus._signal_router.add(self)
+            self._proxy_handlers = [
+                self._proxy.connect("g-properties-changed", self._on_properties_changed),
+            ]
+        else:
+            self._proxy_handlers = [
+                self._proxy.connect("g-properties-changed", self._on_properties_changed),
+                self._proxy.connect("g-signal", self._on_signal_received),
+            ]
+
+    @property
+    def object_path(self):
+        """The D-Bus object path of this object, as str."""
+        return self._object_path
+
+    @classmethod
+    def _instance(cls, object_path):
+        # Returns the existing object of this class for the given object path,
+        # or creates one if there is none. Use this instead of the constructor
+        # so we don't build a second proxy tree for an object we already have.
+        key = (cls, object_path)
+        obj = _RatbagdDBus._registry.get(key)
+        if obj is None:
+            obj = cls(object_path)
+            _RatbagdDBus._registry[key] = obj
+        return obj
+
+    def _release(self):
+        # Called once this object has disappeared from the bus. Drops it and
+        # its children from the registry so an object that later appears
+        # under the same path gets fresh proxies, and disconnects from our
+        # proxy so it can be freed.
+        key = (type(self), self._object_path)
+        if _RatbagdDBus._registry.get(key) is self:
+            del _RatbagdDBus._registry[key]
+        if _RatbagdDBus._signal_router is not None:
+            _RatbagdDBus._signal_router.remove(self)
+        for handler in self._proxy_handlers:
+            self._proxy.disconnect(handler)
+        self._proxy_handlers = []
+        for key in [k for k in _RatbagdDBus._failed_writes if k[0] == self._object_path]:
+            del _RatbagdDBus._failed_writes[key]
+        for child in self._children():
+            child._release()
+
+    def _children(self):
+        # Implement this in derived classes to return the child objects that
+        # have been created so far.
+        return []
+
+    @staticmethod
+    def _bus_name():
+        # The well-known bus name of ratbagd.
+        if os.environ.get('RATBAG_TEST'):
+            return "org.freedesktop.ratbag_devel1"
+        return "org.freedesktop.ratbag1"
+
+    @staticmethod
+    def _proxy_flags():
+        # The flags to create our proxies with. With a signal router, the
+        # proxies neither add match rules to the bus nor subscribe to the
+        # generic signals, the router does that for all of them.
+        if _RatbagdDBus._signal_router is not None:
+            flags = Gio.DBusProxyFlags.DO_NOT_CONNECT_SIGNALS
+            return flags | Gio.DBusProxyFlags.NO_MATCH_RULE
+        return Gio.DBusProxyFlags.NONE
+
+    @staticmethod
+    def _get_bus():
+        # Returns the system bus connection, connecting to it if need be.
+        if _RatbagdDBus._dbus is None:
+            try:
+                _RatbagdDBus._dbus = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+            except GLib.Error as e:
+                raise RatbagdUnavailable(e.message)
+        return _RatbagdDBus._dbus
+
+    @staticmethod
+    def _get_all_properties(objects):
+        # Fetches all properties of the given (interface, object path) pairs
+        # through org.freedesktop.DBus.Properties.GetAll. All calls are sent
+        # before we wait for the first reply, so this costs a single bus round
+        # trip regardless of the number of objects. The replies are dispatched
+        # on a private main context so no other main loop sources run in the
+        # meantime.
+        #
+        # Returns a dict mapping each pair to a dict of the unpacked property
+        # values.
+        _RatbagdDBus._flush_pending_writes()
+        bus = _RatbagdDBus._get_bus()
+        bus_name = _RatbagdDBus._bus_name()
+        results = {}
+        errors = []
+
+        def on_reply(bus, result, key):
+            try:
+                results[key] = bus.call_finish(result).unpack()[0]
+            except GLib.Error as e:
+                errors.append(e)
+
+        context = GLib.MainContext.new()
+        context.push_thread_default()
+        try:
+            for key in objects:
+                interface, object_path = key
+                bus.call(bus_name, object_path,
+                         "org.freedesktop.DBus.Properties", "GetAll",
+                         GLib.Variant("(s)", (interface,)),
+                         GLib.VariantType.new("(a{sv})"),
+                         Gio.DBusCallFlags.NO_AUTO_START, 2000, None,
+                         on_reply, key)
+            while len(results) + len(errors) < len(objects):
+                context.iteration(True)
+        finally:
+            context.pop_thread_default()
+
+        for e in errors:
+            if e.code == Gio.IOErrorEnum.TIMED_OUT:
+                raise RatbagdDBusTimeout(e.message)
+            print(e.message, file=sys.stderr)
+            raise e
+        return results
 
     def _on_properties_changed(self, proxy, changed_props, invalidated_props):
         # Implement this in derived classes to respond to property changes.
@@ -188,22 +475,146 @@ class _RatbagdDBus(GObject.GObject):
 
     def _set_dbus_property(self, property, type, value, readwrite=True):
         # Sets a cached property on the bus.
-
-        # Take our real value and wrap it into a variant. To call
-        # org.freedesktop.DBus.Properties.Set we need to wrap that again
-        # into a (ssv), where v is our value's variant.
-        # args to .Set are "interface name", "function name",  value-variant
+        #
+        # The write is queued and sent asynchronously from the main loop, see
+        # _flush_pending_writes. Repeated writes to the same property before
+        # the queue is flushed only send the latest value.
         val = GLib.Variant("{}".format(type), value)
         if readwrite:
-            pval = GLib.Variant("(ssv)".format(type), (self._interface, property, val))
-            self._proxy.call_sync("org.freedesktop.DBus.Properties.Set",
-                                  pval, Gio.DBusCallFlags.NO_AUTO_START,
-                                  2000, None)
+            counts = _RatbagdDBus._write_counts
+            counts[self._object_path] = counts.get(self._object_path, 0) + 1
+            key = (self._interface, self._object_path, property)
+            # Re-insert so the queue stays ordered by the latest write.
+            _RatbagdDBus._pending_writes.pop(key, None)
+            _RatbagdDBus._pending_writes[key] = (self, val)
+            if _RatbagdDBus._flush_source == 0:
+                _RatbagdDBus._flush_source = GLib.idle_add(_RatbagdDBus._on_flush_idle)
 
         # This is our local copy, so we don't have to wait for the async
         # update
         self._proxy.set_cached_property(property, val)
 
+    @staticmethod
+    def _on_flush_idle():
+        _RatbagdDBus._flush_source = 0
+        _RatbagdDBus._flush_pending_writes()
+        return False
+
+    @staticmethod
+    def _flush_pending_writes(sync=False):
+        # Sends all queued property writes to ratbagd in one burst. The calls
+        # are asynchronous unless sync is True, but messages on a connection
+        # are delivered in order so any method call made after this sees the
+        # new values. Rejected writes are recorded in _failed_writes.
+        #
+        # Returns a RatbagdFuture resolving once ratbagd replied to all of the
+        # writes.
+        if _RatbagdDBus._flush_source != 0:
+            GLib.Source.remove(_RatbagdDBus._flush_source)
+            _RatbagdDBus._flush_source = 0
+
+        future = RatbagdFuture()
+        writes = _RatbagdDBus._pending_writes
+        _RatbagdDBus._pending_writes = {}
+        # The number of writes still waiting for their reply.
+        remaining = [len(writes)]
+        for (interface, object_path, property), (obj, val) in writes.items():
+            # To call org.freedesktop.DBus.Properties.Set we need to wrap our
+            # value's variant again into a (ssv).
+            # args to .Set are "interface name", "function name",  value-variant
+            pval = GLib.Variant("(ssv)", (interface, property, val))
+            if sync:
+                try:
+                    obj._proxy.call_sync("org.freedesktop.DBus.Properties.Set",
+                                         pval, Gio.DBusCallFlags.NO_AUTO_START,
+                                         2000, None)
+                except GLib.Error as e:
+                    obj._on_property_set(property, e.message, sync=True)
+                else:
+                    obj._on_property_set(property, None, sync=True)
+            else:
+                obj._proxy.call("org.freedesktop.DBus.Properties.Set",
+                                pval, Gio.DBusCallFlags.NO_AUTO_START,
+                                2000, None, _RatbagdDBus._on_property_set_finished,
+                                (obj, property, remaining, future))
+        if sync or not writes:
+            future.set_result(None)
+        return future
+
+    @staticmethod
+    def _on_property_set_finished(proxy, result, data):
+        obj, property, remaining, future = data
+        try:
+            proxy.call_finish(result)
+        except GLib.Error as e:
+            obj._on_property_set(property, e.message)
+        else:
+            obj._on_property_set(property, None)
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            future.set_result(None)
+
+    def _on_property_set(self, property, error, sync=False):
+        # Records the outcome of a property write. If ratbagd rejected it,
+        # our local copy still has the rejected value, so it is read back
+        # from ratbagd.
+        key = (self._object_path, property)
+        if error is None:
+            _RatbagdDBus._failed_writes.pop(key, None)
+            return
+        print("Failed to set {}: {}".format(property, error), file=sys.stderr)
+        _RatbagdDBus._failed_writes[key] = "{} on {}: {}".format(property, self._object_path, error)
+        self._reread_dbus_property(property, sync)
+
+    @staticmethod
+    def _get_failed_writes(object_paths):
+        # Returns the messages of the rejected writes to the objects with the
+        # given paths.
+        object_paths = set(object_paths)
+        return [message for (object_path, property), message
+                in _RatbagdDBus._failed_writes.items()
+                if object_path in object_paths]
+
+    def _reread_dbus_property(self, property, sync=False):
+        # Replaces our local copy of the given property with ratbagd's value
+        # through org.freedesktop.DBus.Properties.Get.
+        args = GLib.Variant("(ss)", (self._interface, property))
+        if sync:
+            try:
+                reply = self._proxy.call_sync("org.freedesktop.DBus.Properties.Get",
+                                              args, Gio.DBusCallFlags.NO_AUTO_START,
+                                              2000, None)
+            except GLib.Error as e:
+                print("Failed to read {}: {}".format(property, e.message), file=sys.stderr)
+                return
+            self._on_dbus_property_reread(property, reply)
+        else:
+            self._proxy.call("org.freedesktop.DBus.Properties.Get",
+                             args, Gio.DBusCallFlags.NO_AUTO_START,
+                             2000, None, self._on_dbus_property_get_finished,
+                             property)
+
+    def _on_dbus_property_get_finished(self, proxy, result, property):
+        try:
+            reply = proxy.call_finish(result)
+        except GLib.Error as e:
+            print("Failed to read {}: {}".format(property, e.message), file=sys.stderr)
+            return
+        self._on_dbus_property_reread(property, reply)
+
+    def _on_dbus_property_reread(self, property, reply):
+        # A newer write that is still queued wins over the value read back.
+        if (self._interface, self._object_path, property) in _RatbagdDBus._pending_writes:
+            return
+        val = reply.get_child_value(0).get_variant()
+        self._proxy.set_cached_property(property, val)
+        # Notify as if ratbagd had changed the property, so the widgets show
+        # its value again.
+        self._on_properties_changed(self._proxy, {property: val.unpack()}, [])
+        name = re.sub(r"(?<!^)(?=[A-Z])", "-", property).lower()
+        if any(pspec.name == name for pspec in self.list_properties()):
+            self.notify(name)
+
     def _dbus_call(self, method, type, *value):
         # Calls a method synchronously on the bus, using the given method name,
         # type signature and values.
@@ -212,11 +623,48 @@ class _RatbagdDBus(GObject.GObject):
         # appropriate RatbagError* or RatbagdDBus* exception, or GLib.Error if
         # it is an unexpected exception that probably shouldn't be passed up to
         # the UI.
+        #
+        # Any queued property writes are sent before the method call.
+        _RatbagdDBus._flush_pending_writes()
         val = GLib.Variant("({})".format(type), value)
+        return self._dbus_result(lambda: self._proxy.call_sync(method, val,
+                                                               Gio.DBusCallFlags.NO_AUTO_START,
+                                                               2000, None))
+
+    def _dbus_call_async(self, method, type, *value):
+        # Like _dbus_call, but does not block. Returns a RatbagdFuture that
+        # resolves to the result or the exception _dbus_call would raise.
+        _RatbagdDBus._flush_pending_writes()
+        future = RatbagdFuture()
+        val = GLib.Variant("({})".format(type), value)
+        self._proxy.call(method, val, Gio.DBusCallFlags.NO_AUTO_START,
+                         2000, None, self._on_dbus_call_finished, future)
+        return future
+
+    def _on_dbus_call_finished(self, proxy, result, future):
         try:
-            res = self._proxy.call_sync(method, val,
-                                        Gio.DBusCallFlags.NO_AUTO_START,
-                                        2000, None)
+            res = self._dbus_result(lambda: proxy.call_finish(result))
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(res)
+
+    def _cache_on_success(self, future, property, type, value):
+        # Updates our local copy of the given property once the call behind
+        # the future has succeeded, the way the synchronous methods do after
+        # their call returns.
+        def on_done(future):
+            if future.exception() is None:
+                self._set_dbus_property(property, type, value, readwrite=False)
+        future.add_done_callback(on_done)
+        return future
+
+    @staticmethod
+    def _dbus_result(call):
+        # Invokes the given callable that returns the reply of a method call
+        # and maps it to its result or to an exception, see _dbus_call.
+        try:
+            res = call()
             if res in EXCEPTION_TABLE:
                 raise EXCEPTION_TABLE[res]
             return res.unpack()[0]  # Result is always a tuple
@@ -233,6 +681,176 @@ class _RatbagdDBus(GObject.GObject):
         return other and self._object_path == other._object_path
 
 
+class _RatbagdLazyList(Sequence):
+    """A read-only list of ratbagd objects that are created from their object
+    paths the first time they are accessed."""
+
+    def __init__(self, object_paths, factory):
+        """@param object_paths The object paths of the objects, as [str]
+        @param factory The function that creates an object from its object
+                       path, as callable(str)
+        """
+        self._object_paths = list(object_paths)
+        self._objects = [None] * len(self._object_paths)
+        self._factory = factory
+
+    def __len__(self):
+        return len(self._object_paths)
+
+    def created(self):
+        """Returns the objects that have been created so far."""
+        return [obj for obj in self._objects if obj is not None]
+
+    def create_all(self):
+        """Creates the objects that have not been created yet."""
+        for index, obj in enumerate(self._objects):
+            if obj is None:
+                self._objects[index] = self._factory(self._object_paths[index])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        obj = self._objects[index]
+        if obj is None:
+            obj = self._factory(self._object_paths[index])
+            self._objects[index] = obj
+        return obj
+
+
+class _RatbagdSignalRouter:
+    """Holds the only match rules we add to the bus: one for all signals
+    ratbagd emits and one for its name owner changes. The proxies are created
+    with NO_MATCH_RULE in this mode, so they still receive PropertiesChanged
+    and NameOwnerChanged and keep their caches up to date, but the bus holds
+    two match rules for us instead of several for each object. The generic
+    signals, which the proxies don't subscribe to with DO_NOT_CONNECT_SIGNALS,
+    are dispatched by the router to the object with the matching interface and
+    object path.
+
+    NO_MATCH_RULE requires GLib 2.72, see supported().
+    """
+
+    def __init__(self, bus, bus_name):
+        self._objects = weakref.WeakValueDictionary()
+        self._subscription = bus.signal_subscribe(bus_name, None, None, None,
+                                                  None,
+                                                  Gio.DBusSignalFlags.NONE,
+                                                  self._on_signal)
+        # Only here for its match rule; the proxies track the name owner.
+        self._name_owner_subscription = bus.signal_subscribe("org.freedesktop.DBus",
+                                                             "org.freedesktop.DBus",
+                                                             "NameOwnerChanged",
+                                                             "/org/freedesktop/DBus",
+                                                             bus_name,
+                                                             Gio.DBusSignalFlags.NONE,
+                                                             lambda *args: None)
+
+    @staticmethod
+    def supported():
+        return hasattr(Gio.DBusProxyFlags, "NO_MATCH_RULE")
+
+    def add(self, obj):
+        self._objects[(obj._interface, obj._object_path)] = obj
+
+    def remove(self, obj):
+        key = (obj._interface, obj._object_path)
+        if self._objects.get(key) is obj:
+            del self._objects[key]
+
+    def _on_signal(self, bus, sender_name, object_path, interface_name,
+                   signal_name, parameters):
+        # The proxies handle PropertiesChanged themselves.
+        if interface_name == "org.freedesktop.DBus.Properties":
+            return
+        obj = self._objects.get((interface_name, object_path))
+        if obj is not None:
+            obj._on_signal_received(obj._proxy, sender_name, signal_name,
+                                    parameters)
+
+
+class _RatbagdProxyLoader:
+    """Creates the proxies for a set of devices and all of their profiles,
+    resolutions, buttons and LEDs without blocking. The proxies of one level
+    of the object tree are requested concurrently as soon as the properties of
+    their parent arrive, so loading the tree takes as many bus round trips as
+    the tree is deep instead of one per object.
+
+    The proxies are stored in _RatbagdDBus._preloaded_proxies, from where the
+    RatbagdDevice and friends pick them up when they are constructed. Objects
+    whose proxy failed to load fall back to a synchronous proxy then.
+    """
+
+    # The properties listing child object paths, with the interface of those
+    # children.
+    _CHILDREN = {
+        "Device": [("Profiles", "Profile")],
+        "Profile": [("Resolutions", "Resolution"),
+                    ("Buttons", "Button"),
+                    ("Leds", "Led")],
+    }
+
+    def __init__(self, object_paths, callback):
+        """Starts loading the proxies for the given devices.
+
+        @param object_paths The object paths of the devices, as [str]
+        @param callback The function to call from the main loop once all
+                        proxies have been loaded or failed to load
+        """
+        self._callback = callback
+        self._pending = 0
+        self._bus = _RatbagdDBus._get_bus()
+        self._bus_name = _RatbagdDBus._bus_name()
+        for object_path in object_paths:
+            self._load("Device", object_path)
+        if self._pending == 0:
+            GLib.idle_add(self._finish)
+
+    def _load(self, interface, object_path):
+        self._pending += 1
+        Gio.DBusProxy.new(self._bus,
+                          _RatbagdDBus._proxy_flags(),
+                          None,
+                          self._bus_name,
+                          object_path,
+                          "{}.{}".format(self._bus_name, interface),
+                          None,
+                          self._on_proxy_ready,
+                          (interface, object_path))
+
+    def _on_proxy_ready(self, source, result, data):
+        interface, object_path = data
+        try:
+            proxy = Gio.DBusProxy.new_finish(result)
+        except GLib.Error as e:
+            print(e.message, file=sys.stderr)
+            proxy = None
+
+        if proxy is not None:
+            key = (proxy.get_interface_name(), object_path)
+            _RatbagdDBus._preloaded_proxies[key] = proxy
+            # The objects of inactive profiles are only created when they are
+            # needed, see RatbagdProfile, so don't bother loading them.
+            if interface == "Profile":
+                active = proxy.get_cached_property("IsActive")
+                if active is None or not active.unpack():
+                    proxy = None
+        if proxy is not None:
+            for property, child_interface in self._CHILDREN.get(interface, []):
+                children = proxy.get_cached_property(property)
+                if children is None:
+                    continue
+                for child_path in children.unpack():
+                    self._load(child_interface, child_path)
+
+        self._pending -= 1
+        if self._pending == 0:
+            self._finish()
+
+    def _finish(self):
+        self._callback()
+        return False
+
+
 class Ratbagd(_RatbagdDBus):
     """The ratbagd top-level object. Provides a list of devices available
     through ratbagd; actual interaction with the devices is via the
@@ -248,31 +866,90 @@ class Ratbagd(_RatbagdDBus):
             (GObject.SignalFlags.RUN_FIRST, None, (GObject.TYPE_PYOBJECT,)),
         "daemon-disappeared":
             (GObject.SignalFlags.RUN_FIRST, None, ()),
+        "ready":
+            (GObject.SignalFlags.RUN_FIRST, None, ()),
     }
 
-    def __init__(self, api_version):
+    def __init__(self, api_version, bootstrap_async=False,
+                 single_subscription=False):
+        """Connects to ratbagd and creates the objects for its devices.
+
+        @param api_version The ratbagd API version this client requires, as int
+        @param bootstrap_async If True, the device objects are created in the
+                               background and the ready signal is emitted
+                               once they are available. Until then, the list
+                               of devices is empty. Otherwise, they are
+                               created before this constructor returns.
+        @param single_subscription If True, the match rules on the bus are
+                                   shared by all objects instead of added
+                                   per object. This applies to all objects
+                                   created afterwards, and is ignored with
+                                   GLib older than 2.72.
+        """
+        if single_subscription and _RatbagdDBus._signal_router is None and \
+                _RatbagdSignalRouter.supported():
+            _RatbagdDBus._signal_router = _RatbagdSignalRouter(_RatbagdDBus._get_bus(),
+                                                               _RatbagdDBus._bus_name())
         super().__init__("Manager", None)
-        result = self._get_dbus_property("Devices") or []
-        self._devices = [RatbagdDevice(objpath) for objpath in result]
         self._proxy.connect("notify::g-name-owner", self._on_name_owner_changed)
         if self.api_version != api_version:
             raise RatbagdIncompatible(self.api_version or -1, api_version)
 
+        result = self._get_dbus_property("Devices") or []
+        if bootstrap_async:
+            self._ready = False
+            self._devices = []
+            _RatbagdProxyLoader(result, self._on_bootstrap_finished)
+        else:
+            self._ready = True
+            self._devices = [RatbagdDevice._instance(objpath) for objpath in result]
+
+    def _on_bootstrap_finished(self):
+        # Devices may have come and gone while we were loading, so use the
+        # current list. Devices we don't have a proxy for yet are simply
+        # loaded synchronously.
+        result = self._get_dbus_property("Devices") or []
+        try:
+            devices = [RatbagdDevice._instance(objpath) for objpath in result]
+            # Create the objects of the active profiles while their proxies
+            # are at hand; the UI needs them first anyway.
+            for device in devices:
+                profile = device.active_profile
+                for objects in [profile.resolutions, profile.buttons, profile.leds]:
+                    objects.create_all()
+        except (RatbagdUnavailable, GLib.Error) as e:
+            # ratbagd went away while we were loading; we are not going to
+            # become ready.
+            print("Failed to load the devices: {}".format(e), file=sys.stderr)
+            self.emit("daemon-disappeared")
+            return
+        finally:
+            _RatbagdDBus._preloaded_proxies.clear()
+        self._devices = devices
+        self._ready = True
+        self.notify("devices")
+        self.emit("ready")
+
     def _on_name_owner_changed(self, *kwargs):
         self.emit("daemon-disappeared")
 
     def _on_properties_changed(self, proxy, changed_props, invalidated_props):
+        # While bootstrapping, the device list is picked up once the proxies
+        # have been loaded.
+        if not self._ready:
+            return
         if "Devices" in changed_props.keys():
             object_paths = [d._object_path for d in self._devices]
             for object_path in changed_props["Devices"]:
                 if object_path not in object_paths:
-                    device = RatbagdDevice(object_path)
+                    device = RatbagdDevice._instance(object_path)
                     self._devices.append(device)
                     self.emit("device-added", device)
-            for device in self.devices:
+            for device in list(self.devices):
                 if device._object_path not in changed_props["Devices"]:
                     self._devices.remove(device)
                     self.emit("device-removed", device)
+                    device._release()
             self.notify("devices")
 
     @GObject.Property
@@ -284,6 +961,73 @@ class Ratbagd(_RatbagdDBus):
         """A list of RatbagdDevice objects supported by ratbagd."""
         return self._devices
 
+    @GObject.Property
+    def ready(self):
+        """True once the device objects have been created. This is always True
+        unless the object was constructed with bootstrap_async=True."""
+        return self._ready
+
+    def commit_devices(self, devices=None, resync_timeout=0):
+        """Commits the given devices concurrently; committing many devices
+        takes about as long as committing the slowest of them.
+
+        A failed commit is reported by ratbagd through a Resync signal that
+        may arrive after the reply to the commit, so the result can wait for
+        such signals for a while after the last reply.
+
+        @param devices The devices to commit, as [RatbagdDevice], or None for
+                       all devices
+        @param resync_timeout How long to wait for Resync signals after the
+                              last reply, in milliseconds
+        @return A RatbagdFuture resolving to a RatbagdCommitReport
+        """
+        if devices is None:
+            devices = list(self._devices)
+        # Replies are matched up by object path, so each device may only be
+        # committed once.
+        unique = []
+        for device in devices:
+            if device not in unique:
+                unique.append(device)
+        devices = unique
+        report = RatbagdFuture()
+        start = time.monotonic()
+        replies = {}
+        resynced = set()
+        handlers = []
+
+        def on_resync(device):
+            resynced.add(device._object_path)
+
+        def finish():
+            for device, handler in handlers:
+                device.disconnect(handler)
+            results = []
+            for device in devices:
+                error, elapsed = replies[device._object_path]
+                resync = device._object_path in resynced
+                results.append(RatbagdCommitResult(device, error, resync, elapsed))
+            report.set_result(RatbagdCommitReport(results, time.monotonic() - start))
+            return False
+
+        def on_committed(future, device):
+            replies[device._object_path] = (future.exception(), time.monotonic() - start)
+            if len(replies) < len(devices):
+                return
+            if resync_timeout > 0:
+                GLib.timeout_add(resync_timeout, finish)
+            else:
+                finish()
+
+        for device in devices:
+            handlers.append((device, device.connect("resync", on_resync)))
+        for device in devices:
+            future = device.commit_async()
+            future.add_done_callback(partial(on_committed, device=device))
+        if not devices:
+            finish()
+        return report
+
     def __getitem__(self, id):
         """Returns the requested device, or None."""
         for d in self.devices:
@@ -314,7 +1058,7 @@ class RatbagdDevice(_RatbagdDBus):
         # FIXME: if we start adding and removing objects from this list,
         # things will break!
         result = self._get_dbus_property("Profiles") or []
-        self._profiles = [RatbagdProfile(objpath) for objpath in result]
+        self._profiles = [RatbagdProfile._instance(objpath) for objpath in result]
         for profile in self._profiles:
             profile.connect("notify::is-active", self._on_active_profile_changed)
 
@@ -325,6 +1069,9 @@ class RatbagdDevice(_RatbagdDBus):
         if signal_name == "Resync":
             self.emit("resync")
 
+    def _children(self):
+        return self._profiles
+
     def _on_active_profile_changed(self, profile, pspec):
         if profile.is_active:
             self.emit("active-profile-changed", self._profiles[profile.index])
@@ -364,6 +1111,47 @@ class RatbagdDevice(_RatbagdDBus):
         print("No active profile. Please report this bug to the libratbag developers", file=sys.stderr)
         return self._profiles[0]
 
+    def snapshot(self):
+        """Returns a consistent snapshot of the properties of this device and
+        all its profiles, resolutions, buttons and LEDs. The properties of all
+        objects are fetched in one batch of concurrent GetAll calls.
+
+        @return The device state, as RatbagdDeviceSnapshot
+        """
+        bus_name = _RatbagdDBus._bus_name()
+        device_key = ("{}.Device".format(bus_name), self._object_path)
+
+        # The object paths never change, so we can collect them from our
+        # cached properties and request everything in one go.
+        keys = [device_key]
+        tree = []
+        for profile in self._profiles:
+            profile_key = ("{}.Profile".format(bus_name), profile._object_path)
+            keys.append(profile_key)
+            children = []
+            for property, interface in [("Resolutions", "Resolution"),
+                                        ("Buttons", "Button"),
+                                        ("Leds", "Led")]:
+                interface = "{}.{}".format(bus_name, interface)
+                paths = profile._get_dbus_property(property) or []
+                children.append([(interface, p) for p in paths])
+                keys += children[-1]
+            tree.append((profile_key, children))
+        values = _RatbagdDBus._get_all_properties(keys)
+
+        def props(key):
+            return _freeze(values[key])
+
+        profiles = []
+        for profile_key, children in tree:
+            objs = [tuple(RatbagdObjectSnapshot(k[1], props(k)) for k in objects)
+                    for objects in children]
+            profiles.append(RatbagdProfileSnapshot(profile_key[1],
+                                                   props(profile_key),
+                                                   *objs))
+        return RatbagdDeviceSnapshot(self._object_path, props(device_key),
+                                     tuple(profiles))
+
     def commit(self):
         """Commits all changes made to the device.
 
@@ -371,8 +1159,84 @@ class RatbagdDevice(_RatbagdDBus):
         this method and always succeed.  Any failure is handled inside ratbagd
         by emitting the Resync signal, which automatically resynchronizes the
         device. No further interaction is required by the client.
+
+        @raises RatbagdWriteError if ratbagd rejected a property write that
+                has not been written successfully since; nothing is
+                committed then
         """
+        generation = self._write_generation()
+        _RatbagdDBus._flush_pending_writes(sync=True)
+        self._check_failed_writes()
         self._dbus_call("Commit", "")
+        self._on_committed(generation)
+
+    def commit_async(self):
+        """Like commit(), but does not wait for ratbagd to reply. Properties
+        changed while the commit is pending are not part of it, so the
+        profiles stay dirty then.
+
+        The commit is only sent once ratbagd replied to the queued property
+        writes. If it rejected one, nothing is committed and the future fails
+        with RatbagdWriteError, like commit() raises it.
+
+        @return A RatbagdFuture resolving once ratbagd accepted the commit
+        """
+        generation = self._write_generation()
+        future = RatbagdFuture()
+        self._flush_before_commit(future, generation)
+        return future
+
+    def _flush_before_commit(self, future, generation):
+        writes = _RatbagdDBus._flush_pending_writes()
+        writes.add_done_callback(partial(self._on_writes_replied, future, generation))
+
+    def _on_writes_replied(self, future, generation, writes):
+        # Properties written while we waited have to be answered as well
+        # before the commit is sent.
+        if _RatbagdDBus._pending_writes:
+            self._flush_before_commit(future, generation)
+            return
+        try:
+            self._check_failed_writes()
+        except RatbagdWriteError as e:
+            future.set_exception(e)
+            return
+        call = self._dbus_call_async("Commit", "")
+        call.add_done_callback(partial(self._on_commit_replied, future, generation))
+
+    def _on_commit_replied(self, future, generation, call):
+        if call.exception() is not None:
+            future.set_exception(call.exception())
+            return
+        self._on_committed(generation)
+        future.set_result(call.result())
+
+    def _object_paths(self):
+        # The object paths of this device and of all objects below it.
+        object_paths = [self._object_path]
+        for profile in self._profiles:
+            object_paths.append(profile._object_path)
+            for property in ["Resolutions", "Buttons", "Leds"]:
+                object_paths += profile._get_dbus_property(property) or []
+        return object_paths
+
+    def _write_generation(self):
+        # The number of property writes queued on this device so far. It only
+        # grows, so a commit can compare it to tell whether the device was
+        # changed in the meantime.
+        counts = _RatbagdDBus._write_counts
+        return sum(counts.get(p, 0) for p in self._object_paths())
+
+    def _check_failed_writes(self):
+        messages = _RatbagdDBus._get_failed_writes(self._object_paths())
+        if messages:
+            raise RatbagdWriteError("ratbagd rejected {}".format("; ".join(messages)))
+
+    def _on_committed(self, generation):
+        # Clears the dirty flags, unless a property was written after the
+        # commit was sent.
+        if generation != self._write_generation():
+            return
         for profile in self._profiles:
             if profile.dirty:
                 profile._dirty = False
@@ -394,21 +1258,24 @@ class RatbagdProfile(_RatbagdDBus):
 
         # FIXME: if we start adding and removing objects from any of these
         # lists, things will break!
+        # The objects are only created when they are first accessed; for most
+        # profiles that is never.
         result = self._get_dbus_property("Resolutions") or []
-        self._resolutions = [RatbagdResolution(objpath) for objpath in result]
-        self._subscribe_dirty(self._resolutions)
+        self._resolutions = _RatbagdLazyList(result, partial(self._create_child, RatbagdResolution))
 
         result = self._get_dbus_property("Buttons") or []
-        self._buttons = [RatbagdButton(objpath) for objpath in result]
-        self._subscribe_dirty(self._buttons)
+        self._buttons = _RatbagdLazyList(result, partial(self._create_child, RatbagdButton))
 
         result = self._get_dbus_property("Leds") or []
-        self._leds = [RatbagdLed(objpath) for objpath in result]
-        self._subscribe_dirty(self._leds)
+        self._leds = _RatbagdLazyList(result, partial(self._create_child, RatbagdLed))
+
+    def _create_child(self, cls, object_path):
+        obj = cls._instance(object_path)
+        obj.connect("notify", self._on_obj_notify)
+        return obj
 
-    def _subscribe_dirty(self, objects):
-        for obj in objects:
-            obj.connect("notify", self._on_obj_notify)
+    def _children(self):
+        return self._resolutions.created() + self._buttons.created() + self._leds.created()
 
     def _on_obj_notify(self, obj, pspec):
         if not self._dirty:
@@ -529,6 +1396,14 @@ class RatbagdProfile(_RatbagdDBus):
         self._set_dbus_property("IsActive", "b", True, readwrite=False)
         return ret
 
+    def set_active_async(self):
+        """Like set_active(), but does not wait for ratbagd to reply.
+
+        @return A RatbagdFuture resolving to the result of the call
+        """
+        future = self._dbus_call_async("SetActive", "")
+        return self._cache_on_success(future, "IsActive", "b", True)
+
 
 class RatbagdResolution(_RatbagdDBus):
     """Represents a ratbagd resolution."""
@@ -603,12 +1478,28 @@ class RatbagdResolution(_RatbagdDBus):
         self._set_dbus_property("IsDefault", "b", True, readwrite=False)
         return ret
 
+    def set_default_async(self):
+        """Like set_default(), but does not wait for ratbagd to reply.
+
+        @return A RatbagdFuture resolving to the result of the call
+        """
+        future = self._dbus_call_async("SetDefault", "")
+        return self._cache_on_success(future, "IsDefault", "b", True)
+
     def set_active(self):
         """Set this resolution to be the active one."""
         ret = self._dbus_call("SetActive", "")
         self._set_dbus_property("IsActive", "b", True, readwrite=False)
         return ret
 
+    def set_active_async(self):
+        """Like set_active(), but does not wait for ratbagd to reply.
+
+        @return A RatbagdFuture resolving to the result of the call
+        """
+        future = self._dbus_call_async("SetActive", "")
+        return self._cache_on_success(future, "IsActive", "b", True)
+
 
 class RatbagdButton(_RatbagdDBus):
     """Represents a ratbagd button."""
@@ -774,6 +1665,13 @@ class RatbagdButton(_RatbagdDBus):
         """Disables this button."""
         return self._dbus_call("Disable", "")
 
+    def disable_async(self):
+        """Like disable(), but does not wait for ratbagd to reply.
+
+        @return A RatbagdFuture resolving to the result of the call
+        """
+        return self._dbus_call_async("Disable", "")
+
 
 class RatbagdMacro(GObject.Object):
     """Represents a button macro. Note that it uses keycodes as defined by
@@ -14,11 +14,15 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import bisect
+import sys
+
+from .connections import SignalConnections
 from .gi_composites import GtkTemplate
 
 import gi
 gi.require_version("Gtk", "3.0")
-from gi.repository import GObject, Gtk  # noqa
+from gi.repository import GLib, GObject, Gtk  # noqa
 
 
 @GtkTemplate(ui="/org/freedesktop/Piper/ui/ResolutionRow.ui")
@@ -33,42 +37,68 @@ class ResolutionRow(Gtk.ListBoxRow):
     revealer = GtkTemplate.Child()
     scale = GtkTemplate.Child()
 
+    # The minimum time between two resolution writes while the scale is being
+    # dragged, in milliseconds.
+    _WRITE_INTERVAL = 100
+
     def __init__(self, device, resolution, *args, **kwargs):
         Gtk.ListBoxRow.__init__(self, *args, **kwargs)
         self.init_template()
 
+        # Connected first so that the pending resolution is written before
+        # the handlers below are disconnected.
+        self.connect("destroy", self._on_destroy)
+
         self._resolution = None
         self._resolution_handler = 0
-        self._active_handler = 0
+        # The handlers on the current resolution.
+        self._resolution_connections = SignalConnections(self)
         self._scale_handler = self.scale.connect("value-changed",
                                                  self._on_scale_value_changed)
+        # The resolution set on the scale but not yet written to
+        # RatbagdResolution, see _on_scale_value_changed.
+        self._pending_xres = None
+        self._write_timeout_id = 0
 
-        device.connect("active-profile-changed",
-                       self._on_active_profile_changed, resolution.index)
+        self._connections = SignalConnections(self)
+        self._connections.connect(device, "active-profile-changed",
+                                  self._on_active_profile_changed, resolution.index)
 
         self._init_values(resolution)
 
     def _init_values(self, resolution):
-        if self._resolution_handler > 0:
-            self._resolution.disconnect(self._resolution_handler)
-        if self._active_handler > 0:
-            self._resolution.disconnect(self._active_handler)
+        self.write_pending_resolution()
+        self._resolution_connections.disconnect_all()
         self._resolution = resolution
-        self._resolution_handler = resolution.connect("notify::resolution",
-                                                      self._on_resolution_changed)
-        self._active_handler = resolution.connect("notify::is-active",
-                                                  self._on_is_active_changed)
+        self._resolution_handler = self._resolution_connections.connect(resolution, "notify::resolution",
+                                                                        self._on_resolution_changed)
+        self._resolution_connections.connect(resolution, "notify::is-active",
+                                             self._on_is_active_changed)
 
         xres = resolution.resolution[0]
-        minres = resolution.resolutions[0]
-        maxres = resolution.resolutions[-1]
-        self.resolutions = resolution.resolutions
+        # The permitted resolutions in ascending order, and the index of each
+        # of them, to snap the scale's value to them with a binary search.
+        self.resolutions = sorted(resolution.resolutions)
+        self._resolution_indices = {r: i for i, r in enumerate(self.resolutions)}
+        minres = self.resolutions[0]
+        maxres = self.resolutions[-1]
         self.dpi_label.set_text("{} DPI".format(xres))
         self.active_label.set_visible(resolution.is_active)
 
         with self.scale.handler_block(self._scale_handler):
             self.scale.props.adjustment.configure(xres, minres, maxres, 50, 50, 0)
             self.scale.set_value(xres)
+        self._update_increments(xres)
+
+    def _update_increments(self, value):
+        # libratbag provides a fake-exponential range with the deltas
+        # increasing as the resolution goes up. Make sure we set our
+        # steps to the next available value.
+        idx = self._resolution_indices.get(value)
+        if idx is not None and idx < len(self.resolutions) - 1:
+            delta = self.resolutions[idx + 1] - self.resolutions[idx]
+            self.scale.props.adjustment.set_step_increment(delta)
+            self.scale.props.adjustment.set_page_increment(delta)
 
     def _on_active_profile_changed(self, device, profile, index):
         resolution = profile.resolutions[index]
@@ -80,25 +110,17 @@ class ResolutionRow(Gtk.ListBoxRow):
         # Cursor-controlled slider may get out of the GtkAdjustment's range
         value = min(max(self.resolutions[0], value), self.resolutions[-1])
 
-        # Find the nearest permitted value to our Gtk.Scale value
-        lo = max([r for r in self.resolutions if r <= value])
-        hi = min([r for r in self.resolutions if r >= value])
-
-        if value - lo < hi - value:
-            value = lo
+        # Find the nearest permitted value to our Gtk.Scale value: the first
+        # one not below it, or the one before that if it is closer.
+        idx = bisect.bisect_left(self.resolutions, value)
+        hi = self.resolutions[idx]
+        if idx > 0 and value - self.resolutions[idx - 1] < hi - value:
+            value = self.resolutions[idx - 1]
         else:
             value = hi
 
         scale.set_value(value)
-
-        # libratbag provides a fake-exponential range with the deltas
-        # increasing as the resolution goes up. Make sure we set our
-        # steps to the next available value.
-        idx = self.resolutions.index(value)
-        if idx < len(self.resolutions) - 1:
-            delta = self.resolutions[idx + 1] - self.resolutions[idx]
-            self.scale.props.adjustment.set_step_increment(delta)
-            self.scale.props.adjustment.set_page_increment(delta)
+        self._update_increments(value)
 
         return True
 
@@ -109,9 +131,35 @@ class ResolutionRow(Gtk.ListBoxRow):
         return False
 
     def _on_scale_value_changed(self, scale):
-        # The scale has been moved, update RatbagdResolution's resolution and
-        # the title label.
+        # The scale has been moved, update the title label right away and
+        # RatbagdResolution's resolution at most once per _WRITE_INTERVAL, so
+        # that dragging the scale does not send every value it passes to
+        # ratbagd. The last value is always written.
         xres = int(self.scale.get_value())
+        self.dpi_label.set_text("{} DPI".format(xres))
+
+        self._pending_xres = xres
+        if self._write_timeout_id == 0:
+            self._write_timeout_id = GLib.timeout_add(self._WRITE_INTERVAL,
+                                                      self._on_write_timeout)
+
+    def _on_write_timeout(self):
+        self._write_timeout_id = 0
+        self.write_pending_resolution()
+        return False
+
+    def write_pending_resolution(self):
+        """Writes the resolution last set on the scale to RatbagdResolution,
+        if it has not been written yet. Call this before committing the
+        device, so that a value still waiting for _WRITE_INTERVAL is not
+        lost."""
+        if self._write_timeout_id != 0:
+            GLib.Source.remove(self._write_timeout_id)
+            self._write_timeout_id = 0
+        if self._pending_xres is None:
+            return
+        xres = self._pending_xres
+        self._pending_xres = None
 
         # Freeze the notify::resolution signal from firing to prevent Piper from
         # ending up in an infinite update loop.
@@ -120,7 +168,9 @@ class ResolutionRow(Gtk.ListBoxRow):
                 self._resolution.resolution = (xres, )
             else:
                 self._resolution.resolution = (xres, xres)
-        self.dpi_label.set_text("{} DPI".format(xres))
+
+    def _on_destroy(self, row):
+        self.write_pending_resolution()
 
     def _on_resolution_changed(self, resolution, pspec):
         # RatbagdResolution's resolution has changed, update the scales.
@@ -136,4 +186,8 @@ class ResolutionRow(Gtk.ListBoxRow):
         reveal = not self.revealer.get_reveal_child()
         self.revealer.set_reveal_child(reveal)
         if reveal:
-            self._resolution.set_active()
+            self._resolution.set_active_async().add_done_callback(self._on_set_active_finished)
+
+    def _on_set_active_finished(self, future):
+        if future.exception() is not None:
+            print("Failed to activate resolution: {}".format(future.exception()), file=sys.stderr)
@@ -16,6 +16,7 @@
 
 from gettext import gettext as _
 
+from .connections import SignalConnections
 from .gi_composites import GtkTemplate
 from .mousemap import MouseMap
 from .ratbagd import RatbagdButton
@@ -59,7 +60,8 @@ class ResolutionsPage(Gtk.Box):
         self._device = ratbagd_device
         self._last_activated_row = None
 
-        self._device.connect("active-profile-changed", self._on_active_profile_changed)
+        self._connections = SignalConnections(self)
+        self._connections.connect(self._device, "active-profile-changed", self._on_active_profile_changed)
         self._handler_500 = self.rate_500.connect("toggled", self._on_report_rate_toggled, 500)
         self._handler_1000 = self.rate_1000.connect("toggled", self._on_report_rate_toggled, 1000)
 
@@ -99,6 +101,13 @@ class ResolutionsPage(Gtk.Box):
         profile = self._device.active_profile
         profile.report_rate = rate
 
+    def write_pending_resolutions(self):
+        """Writes the resolutions set on the scales but not yet written to
+        ratbagd, see ResolutionRow.write_pending_resolution."""
+        for row in self.listbox.get_children():
+            if isinstance(row, ResolutionRow):
+                row.write_pending_resolution()
+
     @GtkTemplate.Callback
     def _on_row_activated(self, listbox, row):
         if row is self._last_activated_row:
@@ -14,12 +14,70 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-from gi.repository import Gio  # noqa
+from gi.repository import Gio, GLib  # noqa
 
-import configparser
+import bisect
+import functools
+import struct
 
+# The layout of svg-lookup.bin, see data/generate-svg-lookup-table.py.
+_BUSES = {'usb': 1, 'bluetooth': 2}
+_HEADER = struct.Struct('>4sHIH')
+_KEY = struct.Struct('>BHHI')
+_RECORD = struct.Struct('>BHHIH')
+
+
+class _SvgLookupTable:
+    # The compiled svg-lookup.ini: a sorted array of packed (bus, vid, pid,
+    # version) keys with the index of their SVG filename, searched with a
+    # binary search.
+
+    def __init__(self, data):
+        magic, version, count, nfiles = _HEADER.unpack_from(data, 0)
+        if magic != b'PSVG' or version != 1:
+            raise ValueError('Invalid SVG lookup table')
+        offset = _HEADER.size
+        self._filenames = []
+        for _ in range(nfiles):
+            length = data[offset]
+            self._filenames.append(data[offset + 1:offset + 1 + length].decode('utf-8'))
+            offset += 1 + length
+        self._records = memoryview(data)[offset:offset + count * _RECORD.size]
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        # The key of the record at the given index, so bisect can search us.
+        start = index * _RECORD.size
+        return bytes(self._records[start:start + _KEY.size])
+
+    def get(self, key, default=None):
+        index = bisect.bisect_left(self, key)
+        if index == self._count or self[index] != key:
+            return default
+        filename = _RECORD.unpack_from(self._records, index * _RECORD.size)[-1]
+        return self._filenames[filename]
+
+
+def _pack_key(bus, vid, pid, version):
+    return _KEY.pack(_BUSES[bus], int(vid, 16), int(pid, 16), int(version))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_svg_index():
+    # Returns the lookup table mapping packed DeviceMatch keys to their SVG
+    # filename. Prefers the table compiled at build time and only falls back
+    # to parsing svg-lookup.ini when it is missing.
+    try:
+        resource = Gio.resources_lookup_data('/org/freedesktop/Piper/svgs/svg-lookup.bin', Gio.ResourceLookupFlags.NONE)
+        return _SvgLookupTable(resource.get_data())
+    except GLib.Error:
+        pass
+
+    import configparser
 
-def get_svg(model):
     resource = Gio.resources_lookup_data('/org/freedesktop/Piper/svgs/svg-lookup.ini', Gio.ResourceLookupFlags.NONE)
 
     data = resource.get_data()
@@ -27,24 +85,31 @@ def get_svg(model):
     config.read_string(data.decode('utf-8'), source='svg-lookup.ini')
     assert config.sections()
 
-    filename = 'fallback.svg'
+    # The first section listing a match wins.
+    index = {}
+    for s in config.sections():
+        for match in config[s]['DeviceMatch'].split(';'):
+            parts = match.split(':')
+            if len(parts) == 3:
+                parts.append('0')
+            index.setdefault(_pack_key(*parts), config[s]['Svg'])
+    return index
 
-    if model.startswith('usb:') or model.startswith('bluetooth:'):
-        bus, vid, pid, version = model.split(':')
-        # Where the version is 0 (virtually all devices) we drop it. This
-        # way the DeviceMatch lines are less confusing.
-        if int(version) == 0:
-            usbid = ':'.join([bus, vid, pid])
-        else:
-            usbid = model
-
-        for s in config.sections():
-            matches = config[s]['DeviceMatch'].split(';')
-            if usbid in matches:
-                filename = config[s]['Svg']
-                break
 
+@functools.lru_cache(maxsize=None)
+def _get_svg_data(filename):
     resource = Gio.resources_lookup_data('/org/freedesktop/Piper/svgs/{}'.format(filename),
                                          Gio.ResourceLookupFlags.NONE)
-
     return resource.get_data()
+
+
+def get_svg(model):
+    filename = 'fallback.svg'
+
+    if model.startswith('usb:') or model.startswith('bluetooth:'):
+        bus, vid, pid, version = model.split(':')
+        # DeviceMatch lines without a version have version 0 (virtually all
+        # devices) in the table.
+        filename = _get_svg_index().get(_pack_key(bus, vid, pid, version), filename)
+
+    return _get_svg_data(filename)
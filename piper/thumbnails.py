@@ -0,0 +1,222 @@
+# Copyright (C) 2019 Red Hat, Inc
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from piper.svg import get_svg
+from piper.worker import run_in_thread
+
+import cairo
+import functools
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import gi
+gi.require_version("Rsvg", "2.0")
+from gi.repository import GLib, Rsvg  # noqa
+
+"""This module renders the device thumbnails shown in the welcome
+perspective. Thumbnails are kept in memory and in a PNG cache under
+$XDG_CACHE_HOME/piper, so they only need to be rendered from the SVG the first
+time a device is seen. Reading, hashing, loading and rendering happens in a
+worker thread; the in-memory cache is only used from the main thread."""
+
+# The logical size of a thumbnail, in pixels.
+THUMBNAIL_SIZE = 50
+
+# The most recently used thumbnails, keyed by SVG hash and scale factor, and
+# the SVG hash of every device model seen so far.
+_THUMBNAIL_CACHE_SIZE = 32
+_thumbnail_cache = OrderedDict()
+_svg_hashes = {}
+
+# The callbacks waiting for a thumbnail that is being loaded, keyed by device
+# model and scale factor. Only used from the main thread.
+_callbacks_pending = {}
+
+# The thumbnails being loaded or rendered in a worker thread, keyed by SVG
+# hash and scale factor, so devices sharing an SVG only render it once. The
+# futures are protected by _render_lock.
+_render_pending = {}
+_render_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_svg_hash(model):
+    # Returns the SVG data of the given device model and its hash. Runs in a
+    # worker thread.
+    svg_bytes = get_svg(model)
+    return svg_bytes, hashlib.sha1(svg_bytes).hexdigest()
+
+
+def _get_cache_path(svg_hash, scale_factor):
+    return os.path.join(GLib.get_user_cache_dir(), "piper", "thumbnails",
+                        "{}-{}@{}.png".format(svg_hash, THUMBNAIL_SIZE, scale_factor))
+
+
+def _load_thumbnail(path):
+    # Loads a thumbnail from the on-disk cache, or returns None if it is not
+    # cached.
+    if not os.path.exists(path):
+        return None
+    try:
+        return cairo.ImageSurface.create_from_png(path)
+    except (OSError, MemoryError, cairo.Error) as e:
+        print("Cannot load cached thumbnail {}: {}".format(path, e), file=sys.stderr)
+        return None
+
+
+def _save_thumbnail(path, surface):
+    # Saves a thumbnail to the on-disk cache. The cache is only an
+    # optimization, so failing to write it is not an error. The thumbnail is
+    # written to a temporary file first so concurrent instances never load a
+    # partially written one.
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+    except OSError:
+        return
+    try:
+        surface.write_to_png(tmp_path)
+        os.replace(tmp_path, path)
+    except (OSError, cairo.Error):
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def _render_thumbnail(svg_bytes, scale_factor):
+    # Renders the device in the given SVG data to a thumbnail of
+    # THUMBNAIL_SIZE at the given scale factor. The SVG is scaled while it is
+    # rendered, straight into a surface of the thumbnail's size.
+    handle = Rsvg.Handle.new_from_data(svg_bytes)
+    if not handle.has_sub("#Device"):
+        handle.close()
+        return None
+    size = THUMBNAIL_SIZE * scale_factor
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, size, size)
+    cr = cairo.Context(surface)
+    cr.scale(size / handle.props.width, size / handle.props.height)
+    handle.render_cairo_sub(cr, id="#Device")
+    handle.close()
+    return surface
+
+
+def _load_or_render_thumbnail(svg_bytes, svg_hash, scale_factor):
+    # Returns the thumbnail from the on-disk cache, rendering and caching it
+    # if it is not cached yet.
+    path = _get_cache_path(svg_hash, scale_factor)
+    surface = _load_thumbnail(path)
+    if surface is None:
+        surface = _render_thumbnail(svg_bytes, scale_factor)
+        if surface is None:
+            return None
+        _save_thumbnail(path, surface)
+    surface.set_device_scale(scale_factor, scale_factor)
+    return surface
+
+
+def _get_thumbnail(model, scale_factor):
+    # Returns the SVG hash of the given device model and its thumbnail, waiting
+    # for another worker thread that is already loading the same thumbnail
+    # instead of rendering it twice. Runs in a worker thread.
+    svg_bytes, svg_hash = _get_svg_hash(model)
+    key = (svg_hash, scale_factor)
+    with _render_lock:
+        future = _render_pending.get(key)
+        if future is None:
+            future = _render_pending[key] = Future()
+            future.set_running_or_notify_cancel()
+            owner = True
+        else:
+            owner = False
+    if not owner:
+        return svg_hash, future.result()
+
+    try:
+        surface = _load_or_render_thumbnail(svg_bytes, svg_hash, scale_factor)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(surface)
+    finally:
+        with _render_lock:
+            _render_pending.pop(key, None)
+    return svg_hash, surface
+
+
+def _cache_thumbnail(key, surface):
+    _thumbnail_cache.pop(key, None)
+    _thumbnail_cache[key] = surface
+    while len(_thumbnail_cache) > _THUMBNAIL_CACHE_SIZE:
+        _thumbnail_cache.popitem(last=False)
+
+
+def _on_thumbnail_loaded(model, scale_factor, future):
+    callbacks = _callbacks_pending.pop((model, scale_factor))
+    try:
+        svg_hash, surface = future.result()
+    except FileNotFoundError:
+        print("Device model {} has no image or its path is invalid".format(model), file=sys.stderr)
+        surface = None
+    except Exception as e:
+        print("Cannot render thumbnail of device model {}: {}".format(model, e), file=sys.stderr)
+        surface = None
+    else:
+        _svg_hashes[model] = svg_hash
+        if surface is None:
+            print("Device model {}'s SVG is incompatible".format(model), file=sys.stderr)
+        else:
+            _cache_thumbnail((svg_hash, scale_factor), surface)
+    for callback in callbacks:
+        callback(surface)
+
+
+def get_thumbnail_async(model, scale_factor, callback):
+    """Fetches the thumbnail of the device with the given model. If it is in
+    memory the callback is invoked right away, otherwise it is invoked from
+    the main loop once the thumbnail is loaded or rendered in a worker thread.
+    Concurrent requests for the same thumbnail share a single render.
+
+    @param model The device model, see ratbagd.RatbagdDevice.model
+    @param scale_factor The scale factor to render the thumbnail at, as int
+    @param callback A callable invoked with the thumbnail of THUMBNAIL_SIZE
+                    times the scale factor pixels with its device scale set,
+                    as cairo.ImageSurface, or None if the device has no SVG
+                    or its SVG is incompatible
+    """
+    svg_hash = _svg_hashes.get(model)
+    if svg_hash is not None:
+        key = (svg_hash, scale_factor)
+        surface = _thumbnail_cache.get(key)
+        if surface is not None:
+            _cache_thumbnail(key, surface)
+            callback(surface)
+            return
+
+    callbacks = _callbacks_pending.get((model, scale_factor))
+    if callbacks is not None:
+        callbacks.append(callback)
+        return
+    _callbacks_pending[(model, scale_factor)] = [callback]
+    run_in_thread(_get_thumbnail, model, scale_factor,
+                  callback=functools.partial(_on_thumbnail_loaded, model, scale_factor))
@@ -16,6 +16,7 @@
 
 from .devicerow import DeviceRow
 from .gi_composites import GtkTemplate
+from .mousemap import prefetch_svg
 
 import gi
 gi.require_version("Gtk", "3.0")
@@ -42,6 +43,13 @@ class WelcomePerspective(Gtk.Box):
         self.init_template()
         self.listbox.set_sort_func(self._listbox_sort_func)
         self.listbox.set_header_func(self._listbox_header_func)
+        # Parse the SVG of the device the user is about to pick while they
+        # pick it, so that the mouse perspective can be set up quickly. Only
+        # the device under the pointer or with the keyboard focus is
+        # prefetched; prefetching all of them would evict them from the
+        # cache again with many devices.
+        self.listbox.connect("motion-notify-event", self._on_listbox_motion_notify)
+        self.listbox.connect("set-focus-child", self._on_listbox_set_focus_child)
 
     def set_devices(self, devices):
         """Sets the devices to present to the user.
@@ -97,6 +105,16 @@ class WelcomePerspective(Gtk.Box):
         if not window.emit("delete-event", Gdk.Event.new(Gdk.EventType.DELETE)):
             window.destroy()
 
+    def _on_listbox_motion_notify(self, listbox, event):
+        row = listbox.get_row_at_y(event.y)
+        if row is not None:
+            prefetch_svg(row.device.model)
+        return False
+
+    def _on_listbox_set_focus_child(self, listbox, row):
+        if row is not None:
+            prefetch_svg(row.device.model)
+
     @GtkTemplate.Callback
     def _on_device_row_activated(self, listbox, row):
         self.emit("device-selected", row.device)
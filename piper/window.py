@@ -69,6 +69,15 @@ class Window(Gtk.ApplicationWindow):
         ratbag.connect("device-removed", self._on_device_removed)
         ratbag.connect("daemon-disappeared", self._on_daemon_disappeared)
 
+        if ratbag.ready:
+            self._present_initial_perspective(ratbag)
+        else:
+            # The devices are still being loaded; show an empty device list
+            # until they are.
+            self._present_welcome_perspective([])
+            ratbag.connect("ready", self._present_initial_perspective)
+
+    def _present_initial_perspective(self, ratbag):
         if len(ratbag.devices) == 0:
             self._present_error_perspective(_("Cannot find any devices"),
                                             _("Please make sure your device is supported and plugged in"))
@@ -130,6 +139,7 @@ class Window(Gtk.ApplicationWindow):
             # We're configuring another device; just notify the user.
             # TODO: show in-app notification?
             print("Device disconnected")
+        mouse_perspective.remove_device(device)
 
     def _add_perspective(self, perspective, ratbag):
         self.stack_perspectives.add_named(perspective, perspective.name)
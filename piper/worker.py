@@ -0,0 +1,55 @@
+# Copyright (C) 2019 Red Hat, Inc
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from gi.repository import GLib  # noqa
+
+"""This module contains the worker threads that parse and rasterize SVGs off
+the GTK+ main thread. Work run on them must not touch any widget; it hands its
+result back to the main loop instead, see run_in_thread."""
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1),
+                                       thread_name_prefix="piper-worker")
+    return _executor
+
+
+def _invoke_callback(callback, future):
+    callback(future)
+    return False
+
+
+def run_in_thread(function, *args, callback=None):
+    """Runs the given function with the given arguments in a worker thread.
+
+    @param function The function to run, as callable
+    @param args The arguments to pass to the function
+    @param callback A callable invoked from the main loop with the returned
+                    future once the function has finished, or None
+    @return The future of the function's result, as
+            concurrent.futures.Future
+    """
+    future = _get_executor().submit(function, *args)
+    if callback is not None:
+        future.add_done_callback(lambda f: GLib.idle_add(_invoke_callback, callback, f))
+    return future